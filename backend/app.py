@@ -1,4 +1,6 @@
 from flask import Flask, jsonify
+import click
+import logging
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
@@ -13,7 +15,17 @@ from routes.backtest import backtest_bp
 from routes.secure import secure_bp  # ✅ Firebase protected route
 
 # Database
-from models.db import db
+from models.db import REPLICA_BIND_PREFIX, add_missing_columns, db
+from models.backtest import Backtest
+
+# Services
+from services.fake_feed import FakePriceFeed
+from services.market_data import use_feed
+from services.upstream import upstream
+from services.quote_stream import quote_hub
+from services.backtest_cache import backtest_cache
+from services.risk import returns_cache
+from services.response_cache import response_cache
 
 # 1. Load environment variables from your .env
 load_dotenv()
@@ -31,11 +43,100 @@ CORS(app, origins=allowed_origins)
 # 3. App configuration
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URI", "sqlite:///algotrading.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+def engine_options(prefix):
+    """Pool settings for one engine from <prefix>_POOL_SIZE / <prefix>_POOL_RECYCLE"""
+    options = {}
+    if os.getenv(f"{prefix}_POOL_SIZE"):
+        options["pool_size"] = int(os.getenv(f"{prefix}_POOL_SIZE"))
+    if os.getenv(f"{prefix}_POOL_RECYCLE"):
+        options["pool_recycle"] = int(os.getenv(f"{prefix}_POOL_RECYCLE"))
+    return options
+
+# Optional read replicas (comma separated). GET handlers marked @read_only use them,
+# except for a user's own reads shortly after they write. With more than one worker, set
+# RESPONSE_CACHE_URL too: the time of each user's last write is shared through it.
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options("DB")
+replica_uris = [uri.strip() for uri in os.getenv("DATABASE_REPLICA_URIS", "").split(",") if uri.strip()]
+app.config["SQLALCHEMY_BINDS"] = {
+    f"{REPLICA_BIND_PREFIX}_{i}": {"url": uri, **engine_options("DB_REPLICA")}
+    for i, uri in enumerate(replica_uris)
+}
+app.config["DB_READ_YOUR_WRITES_SECONDS"] = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
 app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "dev-secret-key")
 
+# Live quote streaming: feed is "yfinance" (default) or "fake" for a local random walk
+app.config["MARKET_DATA_FEED"] = os.getenv("MARKET_DATA_FEED", "yfinance")
+app.config["QUOTE_POLL_INTERVAL"] = float(os.getenv("QUOTE_POLL_INTERVAL", "2"))
+app.config["QUOTE_STREAM_QUEUE_SIZE"] = int(os.getenv("QUOTE_STREAM_QUEUE_SIZE", "100"))
+app.config["QUOTE_STREAM_MAX_SYMBOLS"] = int(os.getenv("QUOTE_STREAM_MAX_SYMBOLS", "50"))
+# Each open stream occupies one server thread until the client disconnects. app.yaml runs
+# gunicorn's threaded worker with 32 threads; keep this well below that (0 = unlimited)
+app.config["QUOTE_STREAM_MAX_CLIENTS"] = int(os.getenv("QUOTE_STREAM_MAX_CLIENTS", "24"))
+
+# Fault injection for the fake feed: mean seconds per call and share of calls that fail
+app.config["FAKE_FEED_LATENCY"] = float(os.getenv("FAKE_FEED_LATENCY", "0"))
+app.config["FAKE_FEED_ERROR_RATE"] = float(os.getenv("FAKE_FEED_ERROR_RATE", "0"))
+
+# Guard around upstream market data: calls per second (0 = unlimited), per-call timeout,
+# and consecutive failures that open the circuit breaker for UPSTREAM_RESET_SECONDS
+app.config["UPSTREAM_RATE_LIMIT"] = float(os.getenv("UPSTREAM_RATE_LIMIT", "5"))
+app.config["UPSTREAM_BURST"] = int(os.getenv("UPSTREAM_BURST", "10"))
+# Tokens of the burst that quote stream pollers leave to interactive calls
+app.config["UPSTREAM_POLL_RESERVE"] = int(os.getenv("UPSTREAM_POLL_RESERVE", "5"))
+app.config["UPSTREAM_TIMEOUT"] = float(os.getenv("UPSTREAM_TIMEOUT", "10"))
+app.config["UPSTREAM_MAX_WORKERS"] = int(os.getenv("UPSTREAM_MAX_WORKERS", "16"))
+app.config["UPSTREAM_FAILURE_THRESHOLD"] = int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "5"))
+app.config["UPSTREAM_RESET_SECONDS"] = float(os.getenv("UPSTREAM_RESET_SECONDS", "30"))
+
+# Quotes, chart history and symbol info are fresh for their TTL, then served stale
+# (flagged in the response) for up to UPSTREAM_MAX_STALE more seconds while they refresh
+app.config["UPSTREAM_CACHE_SIZE"] = int(os.getenv("UPSTREAM_CACHE_SIZE", "1024"))
+app.config["UPSTREAM_QUOTE_TTL"] = float(os.getenv("UPSTREAM_QUOTE_TTL", "5"))
+app.config["UPSTREAM_HISTORY_TTL"] = float(os.getenv("UPSTREAM_HISTORY_TTL", "300"))
+app.config["UPSTREAM_INFO_TTL"] = float(os.getenv("UPSTREAM_INFO_TTL", "86400"))
+app.config["UPSTREAM_MAX_STALE"] = float(os.getenv("UPSTREAM_MAX_STALE", "3600"))
+
+# Number of backtest results memoized in memory per worker (0 disables)
+app.config["BACKTEST_CACHE_SIZE"] = int(os.getenv("BACKTEST_CACHE_SIZE", "256"))
+
+# Threads used for large Monte Carlo runs. Each holds up to 32 MB of working memory,
+# so a run peaks at about MONTE_CARLO_WORKERS * 32 MB
+app.config["MONTE_CARLO_WORKERS"] = int(os.getenv("MONTE_CARLO_WORKERS", "4"))
+
+# Portfolio risk: benchmark for beta, history window and refresh interval of cached closes,
+# and how many aligned returns matrices (one per distinct set of symbols) are kept
+app.config["RISK_BENCHMARK"] = os.getenv("RISK_BENCHMARK", "SPY")
+app.config["RISK_LOOKBACK_DAYS"] = int(os.getenv("RISK_LOOKBACK_DAYS", "365"))
+app.config["RISK_REFRESH_SECONDS"] = int(os.getenv("RISK_REFRESH_SECONDS", "3600"))
+app.config["RISK_MATRIX_CACHE_SIZE"] = int(os.getenv("RISK_MATRIX_CACHE_SIZE", "128"))
+
+# Per-user cache of list responses. Set RESPONSE_CACHE_URL (redis://...) when running
+# more than one worker, so that invalidations reach every process. The order book and
+# strategy runner refuse to start without it (unless RESPONSE_CACHE_SIZE is 0), as the
+# trades they place would otherwise never invalidate the web workers' cached positions.
+app.config["RESPONSE_CACHE_URL"] = os.getenv("RESPONSE_CACHE_URL")
+app.config["RESPONSE_CACHE_SIZE"] = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+app.config["RESPONSE_CACHE_TTL"] = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+
+# Local history store, filled by `flask warm-history` for every strategy symbol plus the
+# watchlist: days of daily / intraday bars kept, and the off-peak window (UTC) it runs in
+app.config["HISTORY_WATCHLIST"] = [s.strip().upper() for s in os.getenv("HISTORY_WATCHLIST", "SPY").split(",") if s.strip()]
+app.config["HISTORY_DAILY_DAYS"] = int(os.getenv("HISTORY_DAILY_DAYS", "3650"))
+app.config["HISTORY_INTRADAY_DAYS"] = int(os.getenv("HISTORY_INTRADAY_DAYS", "59"))
+app.config["HISTORY_WARM_WINDOW"] = os.getenv("HISTORY_WARM_WINDOW", "22:00-06:00")
+app.config["HISTORY_WARM_CONCURRENCY"] = int(os.getenv("HISTORY_WARM_CONCURRENCY", "2"))
+
 # 4. Initialize extensions
 db.init_app(app)
 jwt = JWTManager(app)
+upstream.init_app(app)
+if app.config["MARKET_DATA_FEED"] == "fake":
+    use_feed(FakePriceFeed(latency=app.config["FAKE_FEED_LATENCY"], error_rate=app.config["FAKE_FEED_ERROR_RATE"]))
+quote_hub.init_app(app)
+backtest_cache.init_app(app)
+returns_cache.init_app(app)
+response_cache.init_app(app)
 
 # 5. Register your blueprints
 app.register_blueprint(auth_bp,      url_prefix="/api/auth")
@@ -50,10 +151,81 @@ app.register_blueprint(secure_bp,    url_prefix="/api")  # ✅ Firebase Auth-pro
 def health_check():
     return jsonify({"status": "healthy"})
 
-# 7. Ensure all tables exist
+# 7. Ensure all tables exist, with the columns added to them since they were created
 with app.app_context():
     db.create_all()
+    add_missing_columns(Backtest.input_hash)
+
+def require_shared_response_cache():
+    """Refuse to place trades from a process whose cache invalidations stay local"""
+    if not response_cache.shared:
+        raise click.ClickException(
+            "Trades placed here would leave the web workers' cached positions stale: "
+            "set RESPONSE_CACHE_URL to a shared Redis, or RESPONSE_CACHE_SIZE=0."
+        )
+
+# 8. Live strategy runner: `flask run-strategies` (run it in exactly one process)
+@app.cli.command("run-strategies")
+@click.option("--interval-seconds", default=60.0, help="Seconds between the starts of two cycles.")
+@click.option("--concurrency", type=int, default=lambda: int(os.getenv("STRATEGY_RUNNER_CONCURRENCY", "4")),
+              help="Symbols fetched in parallel per cycle.")
+@click.option("--dry-run", is_flag=True, help="Use the local fake feed and log orders instead of placing them.")
+@click.option("--once", is_flag=True, help="Run a single cycle and exit.")
+def run_strategies(interval_seconds, concurrency, dry_run, once):
+    """Evaluate active strategies on the latest bars and place their orders"""
+    from services.strategy_runner import StrategyRunner
+
+    if not dry_run:
+        require_shared_response_cache()
+    logging.basicConfig(level=logging.INFO)
+    fetch_bars = FakePriceFeed().history if dry_run else None
+    runner = StrategyRunner(app, fetch_bars=fetch_bars, concurrency=concurrency, dry_run=dry_run)
+
+    if once:
+        click.echo(runner.run_cycle())
+        click.echo(runner.latency_summary())
+    else:
+        runner.run_forever(interval_seconds)
+
+# 9. Order book: `flask run-order-book` fills resting limit/stop orders (run it in exactly one process)
+@app.cli.command("run-order-book")
+@click.option("--sync-interval", default=5.0, help="Seconds between picking up new and cancelled orders.")
+@click.option("--fake-feed", is_flag=True, help="Drive the book from the local fake price feed.")
+def run_order_book(sync_interval, fake_feed):
+    """Trigger and fill resting orders as quotes update"""
+    from services.order_manager import OrderManager
+
+    require_shared_response_cache()
+    logging.basicConfig(level=logging.INFO)
+    if fake_feed:
+        use_feed(FakePriceFeed())
+    OrderManager(app).run_forever(quote_hub, sync_interval)
+
+# 10. History warm-up: `flask warm-history` keeps local bars fresh during the off-peak window
+@app.cli.command("warm-history")
+@click.option("--interval-seconds", default=3600.0, help="Seconds between the starts of two passes.")
+@click.option("--concurrency", type=int, default=lambda: app.config["HISTORY_WARM_CONCURRENCY"],
+              help="Symbols downloaded in parallel.")
+@click.option("--once", is_flag=True, help="Run a single pass now, even outside the window, and exit.")
+def warm_history(interval_seconds, concurrency, once):
+    """Download and refresh history for strategy symbols and the watchlist"""
+    from services.history_warmer import HistoryWarmer, parse_window
+
+    logging.basicConfig(level=logging.INFO)
+    warmer = HistoryWarmer(
+        app,
+        watchlist=app.config["HISTORY_WATCHLIST"],
+        concurrency=concurrency,
+        daily_days=app.config["HISTORY_DAILY_DAYS"],
+        intraday_days=app.config["HISTORY_INTRADAY_DAYS"],
+        window=parse_window(app.config["HISTORY_WARM_WINDOW"])
+    )
+
+    if once:
+        click.echo(warmer.run(ignore_window=True))
+    else:
+        warmer.run_forever(interval_seconds)
 
-# 8. Only run Flask’s built-in server in local dev
+# 11. Only run Flask’s built-in server in local dev
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,79 @@
+"""Throughput and cross-check of the bar-loop backtest kernel
+
+Builds a random OHLC path, checks the kernel against the reference Python
+loop for several rule sets, then times the kernel alone in bars per second.
+
+    python benchmarks/backtest_kernel_benchmark.py --bars 2000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.bar_kernel import HAVE_NUMBA, cross_check, initial_state, prepare_bars, rule_config, run_kernel  # noqa: E402
+
+RULE_SETS = [
+    {},
+    {'stop_loss': 0.02},
+    {'take_profit': 0.03},
+    {'trailing_stop': 0.015},
+    {'stop_loss': 0.02, 'take_profit': 0.04, 'trailing_stop': 0.01},
+    {'position_size': 0.5, 'commission': 1.0, 'commission_rate': 0.001},
+    {'stop_loss': 0.01, 'trailing_stop': 0.02, 'position_size': 0.8, 'commission': 2.5, 'commission_rate': 0.0005},
+]
+
+
+def make_history(bars, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, bars)))
+    open_ = np.concatenate([[100.0], close[:-1]]) * np.exp(rng.normal(0, 0.001, bars))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.001, bars)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.001, bars)))
+    index = pd.date_range('2020-01-01', periods=bars, freq='1min')
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close}, index=index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bars', type=int, default=2000000)
+    parser.add_argument('--check-bars', type=int, default=100000,
+                        help='bars replayed through the reference loop (it is slow)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f'numba: {"yes" if HAVE_NUMBA else "no (plain Python kernel)"}')
+    parameters = {'short_ma': 10, 'long_ma': 30}
+
+    sample = make_history(args.check_bars, args.seed)
+    failed = 0
+    for rules in RULE_SETS:
+        check = cross_check(sample, {**parameters, **rules}, 10000.0)
+        failed += not check['match']
+        print(f"{'ok  ' if check['match'] else 'FAIL'} {rules or 'no rules'}: {check['fills']:,} fills, "
+              f"max equity difference {check['max_equity_difference']:.3g}")
+
+    history = make_history(args.bars, args.seed + 1)
+    rules = rule_config({'stop_loss': 0.02, 'take_profit': 0.04, 'trailing_stop': 0.01,
+                         'position_size': 0.8, 'commission': 1.0, 'commission_rate': 0.0005})
+    _, (open_, high, low, close), signal = prepare_bars(history, parameters)
+    arguments = (open_, high, low, close, signal, initial_state(10000.0), rules['position_size'], rules['stop_loss'],
+                 rules['take_profit'], rules['trailing_stop'], rules['commission'], rules['commission_rate'])
+
+    # Compile outside the timing, on a copy of the state so the timed run starts fresh
+    warmup = [a[:1000] if a is not arguments[5] else initial_state(10000.0) for a in arguments[:6]]
+    run_kernel(*warmup, *arguments[6:])
+    started = time.perf_counter()
+    equity, bar, *_ = run_kernel(*arguments)
+    elapsed = time.perf_counter() - started
+    print(f'kernel: {len(close) / elapsed:,.0f} bars/s ({len(close):,} bars, {len(bar):,} fills, {elapsed:.3f}s)')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Throughput benchmark for the in-memory order book
+
+Rests tens of thousands of random limit, stop and stop-limit orders across a
+set of symbols, then drives the book with random-walk price updates and
+reports updates per second, next to a naive scan of every open order.
+
+    python benchmarks/order_book_benchmark.py --orders 50000 --updates 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.order_book import ORDER_TYPES, OrderBook, is_triggered  # noqa: E402
+
+
+def make_orders(count, symbols, rng):
+    orders = []
+    for order_id in range(1, count + 1):
+        order_type = rng.choice(ORDER_TYPES)
+        direction = rng.choice(('buy', 'sell'))
+        stop = round(rng.uniform(50, 150), 2)
+        limit = round(stop + (1 if direction == 'buy' else -1) * rng.uniform(0, 2), 2) \
+            if order_type == 'stop_limit' else round(rng.uniform(50, 150), 2)
+        orders.append((order_id, rng.choice(symbols), order_type, direction, limit, stop))
+    return orders
+
+
+def make_updates(count, symbols, rng):
+    prices = {symbol: 100.0 for symbol in symbols}
+    updates = []
+    for _ in range(count):
+        symbol = rng.choice(symbols)
+        prices[symbol] = min(160.0, max(40.0, prices[symbol] * (1 + rng.gauss(0, 0.002))))
+        updates.append((symbol, prices[symbol]))
+    return updates
+
+
+def run_book(orders, updates):
+    book = OrderBook()
+    for order_id, symbol, order_type, direction, limit, stop in orders:
+        book.add(order_id, symbol, order_type, direction, limit_price=limit, stop_price=stop)
+
+    events = 0
+    started = time.perf_counter()
+    for symbol, price in updates:
+        events += len(book.on_price(symbol, price))
+    return time.perf_counter() - started, events, len(book)
+
+
+def run_scan(orders, updates):
+    # Baseline: check every open order of the symbol on every update
+    resting = {}
+    for order_id, symbol, order_type, direction, limit, stop in orders:
+        resting.setdefault(symbol, {})[order_id] = [order_type, direction, limit, stop, False]
+
+    events = 0
+    started = time.perf_counter()
+    for symbol, price in updates:
+        for order_id, order in list(resting.get(symbol, {}).items()):
+            order_type, direction, limit, stop, triggered = order
+            if order_type == 'stop_limit' and not triggered and \
+                    is_triggered('stop', direction, price, stop_price=stop):
+                order[4] = triggered = True
+                events += 1
+            if is_triggered(order_type, direction, price, limit, stop, triggered):
+                del resting[symbol][order_id]
+                events += 1
+    return time.perf_counter() - started, events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--updates', type=int, default=200000)
+    parser.add_argument('--symbols', type=int, default=20)
+    parser.add_argument('--scan-updates', type=int, default=2000,
+                        help='updates replayed through the naive scan (it is slow)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    symbols = [f'SYM{i}' for i in range(args.symbols)]
+    orders = make_orders(args.orders, symbols, rng)
+    updates = make_updates(args.updates, symbols, rng)
+
+    elapsed, events, remaining = run_book(orders, updates)
+    print(f'order book: {len(updates) / elapsed:,.0f} updates/s '
+          f'({len(updates):,} updates, {events:,} events, {remaining:,} orders still resting)')
+
+    scan_updates = updates[:args.scan_updates]
+    book_elapsed, book_events, _ = run_book(orders, scan_updates)
+    scan_elapsed, scan_events = run_scan(orders, scan_updates)
+    print(f'naive scan: {len(scan_updates) / scan_elapsed:,.0f} updates/s vs '
+          f'{len(scan_updates) / book_elapsed:,.0f} for the book on the same {len(scan_updates):,} updates '
+          f'(events {scan_events:,} vs {book_events:,})')
+
+
+if __name__ == '__main__':
+    main()
@@ -18,6 +18,9 @@ class Backtest(db.Model):
     equity_curve = db.Column(db.JSON, nullable=False, default={})
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Content hash of the result-affecting inputs, used to reuse identical runs
+    input_hash = db.Column(db.String(64), index=True)
+    
     # Foreign keys
     strategy_id = db.Column(db.Integer, db.ForeignKey('strategies.id'), nullable=False)
     
@@ -1,3 +1,152 @@
+from functools import wraps
+import math
+import random
+import time
+
+from flask import current_app, g, has_request_context
+from flask_jwt_extended import get_jwt_identity
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import DBAPIError
+
+from services.response_cache import LocalBackend, RedisBackend, response_cache
+
+# Bind keys starting with this prefix are read replicas of the primary database
+REPLICA_BIND_PREFIX = 'replica'
+
+
+def _current_user_id():
+    if not has_request_context():
+        return None
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        # No JWT was verified for this request
+        return None
+
+
+# Last write per user, kept here when the response cache has no shared (Redis) store
+_local_writes = LocalBackend(10000)
+
+
+def _write_store():
+    backend = response_cache.backend
+    return backend if isinstance(backend, RedisBackend) else _local_writes
+
+
+def _last_write_key(user_id):
+    return f'db:last-write:{user_id}'
+
+
+class RoutingSession(Session):
+    """Session that sends queries from read-only handlers to a replica
+
+    Everything else, including any flush, goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('db_read_only'):
+            replicas = sorted(key for key in self._db.engines if key and key.startswith(REPLICA_BIND_PREFIX))
+            if replicas:
+                # Stick to one replica for the whole request
+                if 'db_replica' not in g:
+                    g.db_replica = random.choice(replicas)
+                return self._db.engines[g.db_replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_write(session, flush_context):
+    session.info['has_writes'] = True
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _clear_write(session):
+    session.info.pop('has_writes', None)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _record_write(session):
+    if not session.info.pop('has_writes', False) or session.info.get('untracked_write'):
+        return
+    user_id = _current_user_id()
+    if user_id is not None:
+        mark_written(user_id)
+
+
+def mark_written(user_id):
+    """Keep a user's reads on the primary as if they had just written
+
+    For writes made on the user's behalf outside their own requests, such as
+    order fills and strategy trades.
+    """
+    window = current_app.config.get('DB_READ_YOUR_WRITES_SECONDS', 5)
+    _write_store().set(_last_write_key(user_id), repr(time.time()).encode('ascii'), max(1, math.ceil(window)))
+
+
+def commit_untracked():
+    """Commit without keeping the current user's reads on the primary afterwards
+
+    For writes the user did not make and need not read back at once, such
+    as prices refreshed while serving a GET.
+    """
+    db.session.info['untracked_write'] = True
+    try:
+        db.session.commit()
+    finally:
+        db.session.info.pop('untracked_write', None)
+
+
+def read_only(view):
+    """Serve a handler from a replica unless its user wrote very recently
+
+    A user's reads stay on the primary for DB_READ_YOUR_WRITES_SECONDS after
+    each of their commits, so they always see their own writes despite
+    replication lag. With RESPONSE_CACHE_URL set, the time of the last write
+    is kept in that Redis, so every worker sees it, not only the one that
+    served the write. Apply below
+    @jwt_required() so the identity is known.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        window = current_app.config.get('DB_READ_YOUR_WRITES_SECONDS', 5)
+        user_id = _current_user_id()
+        wrote_at = _write_store().get(_last_write_key(user_id)) if user_id is not None else None
+        if wrote_at is None or time.time() - float(wrote_at) > window:
+            g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def _has_column(table_name, column_name):
+    return column_name in {column['name'] for column in inspect(db.engine).get_columns(table_name)}
+
+
+def add_missing_columns(*columns):
+    """Add model columns that an existing table was created without
+
+    create_all() only creates missing tables, so a column added to a model
+    later has to be added to databases that already have its table. Each
+    column is added with its indexes, and only if it is missing, so this is
+    safe to run at every start, from several processes at once.
+    """
+    for column in columns:
+        table = column.table
+        if _has_column(table.name, column.name):
+            continue
 
-db = SQLAlchemy()
+        column_type = column.type.compile(dialect=db.engine.dialect)
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                for index in table.indexes:
+                    if column.name in index.columns:
+                        index.create(connection, checkfirst=True)
+        except DBAPIError:
+            # Another process may have added it first
+            if not _has_column(table.name, column.name):
+                raise
@@ -0,0 +1,44 @@
+from datetime import datetime
+from models.db import db
+
+class Order(db.Model):
+    __tablename__ = 'orders'
+
+    id = db.Column(db.Integer, primary_key=True)
+    symbol = db.Column(db.String(20), nullable=False)
+    order_type = db.Column(db.String(10), nullable=False)  # "limit", "stop" or "stop_limit"
+    direction = db.Column(db.String(4), nullable=False)  # "buy" or "sell"
+    quantity = db.Column(db.Float, nullable=False)
+    limit_price = db.Column(db.Float, nullable=True)
+    stop_price = db.Column(db.Float, nullable=True)
+    # "open", "triggered" (stop-limit resting as a limit), "filled", "cancelled", "expired" or "rejected"
+    status = db.Column(db.String(10), nullable=False, default='open', index=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    fill_price = db.Column(db.Float, nullable=True)
+    filled_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    # Foreign keys
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False, index=True)
+    trade_id = db.Column(db.Integer, db.ForeignKey('trades.id'), nullable=True)
+
+    def to_dict(self):
+        """Convert to dictionary for API responses"""
+        return {
+            'id': self.id,
+            'symbol': self.symbol,
+            'order_type': self.order_type,
+            'direction': self.direction,
+            'quantity': self.quantity,
+            'limit_price': self.limit_price,
+            'stop_price': self.stop_price,
+            'status': self.status,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'fill_price': self.fill_price,
+            'filled_at': self.filled_at.isoformat() if self.filled_at else None,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'portfolio_id': self.portfolio_id,
+            'trade_id': self.trade_id
+        }
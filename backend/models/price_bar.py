@@ -0,0 +1,53 @@
+from datetime import datetime
+from models.db import db
+
+class PriceBar(db.Model):
+    """One locally stored OHLCV bar; timestamps are naive UTC"""
+    __tablename__ = 'price_bars'
+    __table_args__ = (
+        db.UniqueConstraint('symbol', 'interval', 'timestamp', name='uq_price_bar'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    symbol = db.Column(db.String(20), nullable=False)
+    interval = db.Column(db.String(5), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    open = db.Column(db.Float, nullable=False)
+    high = db.Column(db.Float, nullable=False)
+    low = db.Column(db.Float, nullable=False)
+    close = db.Column(db.Float, nullable=False)
+    volume = db.Column(db.Float, nullable=False, default=0)
+
+class HistorySync(db.Model):
+    """How far the warm-up job has downloaded one symbol and interval
+
+    [covered_from, covered_to) is the UTC range stored in price_bars without
+    gaps; covered_to only advances after a slice is committed, so an
+    interrupted run resumes where it stopped.
+    """
+    __tablename__ = 'history_syncs'
+    __table_args__ = (
+        db.UniqueConstraint('symbol', 'interval', name='uq_history_sync'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    symbol = db.Column(db.String(20), nullable=False)
+    interval = db.Column(db.String(5), nullable=False)
+    covered_from = db.Column(db.DateTime, nullable=True)
+    covered_to = db.Column(db.DateTime, nullable=True)
+    timezone = db.Column(db.String(64), nullable=True)  # Exchange timezone of the upstream bars
+    synced_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        """Convert to dictionary for API responses"""
+        return {
+            'symbol': self.symbol,
+            'interval': self.interval,
+            'covered_from': self.covered_from.isoformat() if self.covered_from else None,
+            'covered_to': self.covered_to.isoformat() if self.covered_to else None,
+            'timezone': self.timezone,
+            'synced_at': self.synced_at.isoformat() if self.synced_at else None,
+            'error': self.error
+        }
@@ -0,0 +1,117 @@
+"""Bulk serialization for list endpoints
+
+Each function selects exactly the columns its response needs with a Core
+query and returns plain dicts, skipping ORM entity hydration and loading of
+unused columns (notably the large JSON blobs on backtests). Derived fields
+are computed by the database with the same operations, in the same order,
+as the models' to_dict(), so the JSON produced is byte-for-byte identical.
+"""
+from math import ceil
+
+from flask import abort
+from sqlalchemy import func, select
+
+from models.backtest import Backtest
+from models.db import db
+from models.portfolio import Position, Trade
+from models.strategy import Strategy
+
+STRATEGY_COLUMNS = (
+    Strategy.id, Strategy.name, Strategy.description, Strategy.parameters, Strategy.indicators,
+    Strategy.is_active, Strategy.created_at, Strategy.updated_at, Strategy.user_id
+)
+
+BACKTEST_COLUMNS = (
+    Backtest.id, Backtest.name, Backtest.start_date, Backtest.end_date, Backtest.initial_capital,
+    Backtest.final_capital, Backtest.profit_loss, Backtest.profit_loss_percent, Backtest.max_drawdown,
+    Backtest.sharpe_ratio, Backtest.created_at, Backtest.strategy_id
+)
+
+POSITION_COLUMNS = (
+    Position.id, Position.symbol, Position.quantity, Position.entry_price, Position.current_price,
+    (Position.quantity * Position.current_price).label('market_value'),
+    ((Position.current_price - Position.entry_price) * Position.quantity).label('profit_loss'),
+    (((Position.current_price - Position.entry_price) / Position.entry_price) * 100).label('profit_loss_percent'),
+    Position.created_at, Position.updated_at, Position.portfolio_id
+)
+
+TRADE_COLUMNS = (
+    Trade.id, Trade.symbol, Trade.quantity, Trade.price, Trade.direction,
+    (Trade.quantity * Trade.price).label('total_value'),
+    Trade.executed_at, Trade.portfolio_id, Trade.strategy_id
+)
+
+# Date and datetime columns, rendered with isoformat() like to_dict() does
+TEMPORAL_FIELDS = {'start_date', 'end_date', 'created_at', 'updated_at', 'executed_at'}
+
+
+def _dicts(statement):
+    result = db.session.execute(statement)
+    keys = list(result.keys())
+    temporal = [i for i, key in enumerate(keys) if key in TEMPORAL_FIELDS]
+
+    rows = []
+    for row in result:
+        values = list(row)
+        for i in temporal:
+            values[i] = values[i].isoformat()
+        rows.append(dict(zip(keys, values)))
+    return rows
+
+
+def strategy_dicts(user_id):
+    """Strategy.to_dict() for every strategy of a user"""
+    return _dicts(select(*STRATEGY_COLUMNS).where(Strategy.user_id == user_id))
+
+
+def backtest_dicts(user_id):
+    """Backtest.to_dict() for every backtest of a user's strategies, newest first"""
+    return _dicts(
+        select(*BACKTEST_COLUMNS)
+        .join(Strategy, Backtest.strategy_id == Strategy.id)
+        .where(Strategy.user_id == user_id)
+        .order_by(Backtest.created_at.desc())
+    )
+
+
+def position_dicts(portfolio_id):
+    """Position.to_dict() for every position in a portfolio"""
+    return _dicts(select(*POSITION_COLUMNS).where(Position.portfolio_id == portfolio_id))
+
+
+def recent_trade_dicts(portfolio_id, limit):
+    """Trade.to_dict() for the most recent trades in a portfolio"""
+    return _dicts(
+        select(*TRADE_COLUMNS)
+        .where(Trade.portfolio_id == portfolio_id)
+        .order_by(Trade.executed_at.desc())
+        .limit(limit)
+    )
+
+
+def trade_page(portfolio_id, page, per_page, max_per_page=None):
+    """One page of Trade.to_dict() plus totals, with db.paginate()'s semantics
+
+    Returns (items, total, pages) and aborts with 404 for out-of-range pages
+    exactly like Query.paginate() with error_out enabled.
+    """
+    if max_per_page is not None:
+        per_page = min(per_page, max_per_page)
+    if page < 1 or per_page < 1:
+        abort(404)
+
+    items = _dicts(
+        select(*TRADE_COLUMNS)
+        .where(Trade.portfolio_id == portfolio_id)
+        .order_by(Trade.executed_at.desc())
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    )
+    if not items and page != 1:
+        abort(404)
+
+    total = db.session.execute(
+        select(func.count()).select_from(Trade).where(Trade.portfolio_id == portfolio_id)
+    ).scalar()
+    pages = ceil(total / per_page) if total else 0
+    return items, total, pages
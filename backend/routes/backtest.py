@@ -1,34 +1,37 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models.db import db
+from models.db import db, read_only
 from models.backtest import Backtest
 from models.strategy import Strategy
-import yfinance as yf
-import pandas as pd
-import numpy as np
+from models.serializers import backtest_dicts
+from services.backtest_cache import backtest_cache, backtest_key, result_from_backtest
+from services.backtest_engine import simulate, simulate_chunked, strategy_returns, walk_forward
+from services.bar_kernel import InvalidRules, simulate_rules, simulate_rules_chunked, uses_rules
+from services.history_store import iter_history, load_history
+from services.market_data import INTRADAY_INTERVALS, bars_per_year
+from services.upstream import UpstreamUnavailable
+from services.monte_carlo import MAX_PATHS, bootstrap
+from services.response_cache import response_cache
 from datetime import datetime
+import numpy as np
 
 backtest_bp = Blueprint('backtest', __name__)
 
 @backtest_bp.route('/', methods=['GET'])
 @jwt_required()
+@read_only
+@response_cache.cached('backtests')
 def get_backtests():
     user_id = get_jwt_identity()
     
-    # Get user's strategies
-    strategies = Strategy.query.filter_by(user_id=user_id).all()
-    strategy_ids = [strategy.id for strategy in strategies]
-    
-    # Get backtests for these strategies
-    backtests = Backtest.query.filter(Backtest.strategy_id.in_(strategy_ids)) \
-                          .order_by(Backtest.created_at.desc()).all()
-    
+    # Get backtests for the user's strategies
     return jsonify({
-        "backtests": [backtest.to_dict() for backtest in backtests]
+        "backtests": backtest_dicts(user_id)
     }), 200
 
 @backtest_bp.route('/<int:backtest_id>', methods=['GET'])
 @jwt_required()
+@read_only
 def get_backtest(backtest_id):
     user_id = get_jwt_identity()
     
@@ -85,88 +88,65 @@ def run_backtest():
         parameters = strategy.parameters
         indicators = strategy.indicators
         symbol = parameters.get('symbol', 'SPY')  # Default to SPY if not specified
+        interval = data.get('interval', '1d')
         
-        # Fetch historical data
-        ticker = yf.Ticker(symbol)
-        history = ticker.history(start=start_date, end=end_date)
+        if interval != '1d' and interval not in INTRADAY_INTERVALS:
+            return jsonify({"error": f"Invalid interval. Valid options are: 1d, {', '.join(INTRADAY_INTERVALS)}"}), 400
         
-        if history.empty:
-            return jsonify({"error": "No historical data available for the specified period"}), 400
+        # Stops, sizing and costs need the bar-by-bar kernel instead of the signal formula.
+        # The kernel only trades long; the formula also holds the short side between signals
+        use_kernel = uses_rules(parameters)
         
-        # Run a simple moving average crossover strategy (this is just an example)
-        # In production, this would use the actual strategy logic from the strategy parameters
-        
-        # Calculate indicators
-        short_period = parameters.get('short_ma', 20)
-        long_period = parameters.get('long_ma', 50)
-        
-        history['short_ma'] = history['Close'].rolling(window=short_period).mean()
-        history['long_ma'] = history['Close'].rolling(window=long_period).mean()
-        
-        # Generate signals
-        history['signal'] = 0
-        history.loc[history['short_ma'] > history['long_ma'], 'signal'] = 1
-        history.loc[history['short_ma'] < history['long_ma'], 'signal'] = -1
-        
-        # Calculate returns
-        history['returns'] = history['Close'].pct_change()
-        history['strategy_returns'] = history['signal'].shift(1) * history['returns']
-        
-        # Calculate equity curve
-        history['equity_curve'] = (1 + history['strategy_returns']).cumprod() * initial_capital
-        history['benchmark_equity'] = (1 + history['returns']).cumprod() * initial_capital
-        
-        # Generate trades
-        trades = []
-        current_position = 0
-        
-        for i in range(1, len(history)):
-            if history['signal'].iloc[i] != history['signal'].iloc[i-1]:
-                # Signal changed, generate a trade
-                if history['signal'].iloc[i] == 1:  # Buy signal
-                    price = history['Close'].iloc[i]
-                    shares = initial_capital / price
-                    trades.append({
-                        'date': history.index[i].strftime('%Y-%m-%d'),
-                        'type': 'buy',
-                        'price': price,
-                        'shares': shares,
-                        'value': price * shares
-                    })
-                    current_position = shares
-                elif history['signal'].iloc[i] == -1 and current_position > 0:  # Sell signal
-                    price = history['Close'].iloc[i]
-                    trades.append({
-                        'date': history.index[i].strftime('%Y-%m-%d'),
-                        'type': 'sell',
-                        'price': price,
-                        'shares': current_position,
-                        'value': price * current_position
-                    })
-                    current_position = 0
-        
-        # Calculate performance metrics
-        final_capital = history['equity_curve'].iloc[-1]
-        profit_loss = final_capital - initial_capital
-        profit_loss_percent = (profit_loss / initial_capital) * 100
-        
-        # Calculate max drawdown
-        peak = history['equity_curve'].expanding(min_periods=1).max()
-        drawdown = (history['equity_curve'] - peak) / peak
-        max_drawdown = drawdown.min() * 100
-        
-        # Calculate Sharpe ratio (annualized)
-        risk_free_rate = 0.02  # Assume 2% risk-free rate
-        returns = history['strategy_returns'].dropna()
-        sharpe_ratio = ((returns.mean() * 252) - risk_free_rate) / (returns.std() * np.sqrt(252))
-        
-        # Prepare equity curve data for JSON
-        equity_data = []
-        for date, value in zip(history.index, history['equity_curve']):
-            equity_data.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'value': float(value)
-            })
+        # Reuse an earlier result for identical inputs unless told otherwise. Ranges reaching
+        # today can still gain or revise bars, so only ranges that are over are ever reused
+        input_hash = backtest_key(parameters, indicators, symbol, start_date, end_date, initial_capital, interval)
+        force_recompute = str(data.get('force_recompute', False)).lower() in ('1', 'true', 'yes')
+        reusable = end_date < datetime.utcnow().date()
+        result = None
+        
+        if reusable and not force_recompute:
+            result = backtest_cache.get(input_hash)
+            
+            if result is None:
+                previous = Backtest.query.filter_by(input_hash=input_hash) \
+                                         .order_by(Backtest.created_at.desc()).first()
+                if previous:
+                    result = result_from_backtest(previous)
+        
+        cached = result is not None
+        
+        if result is None and interval in INTRADAY_INTERVALS:
+            # Stream intraday bars through the engine so memory stays flat however long the range
+            chunks = iter_history(symbol, start_date, end_date, interval)
+            engine = simulate_rules_chunked if use_kernel else simulate_chunked
+            result = engine(chunks, parameters, initial_capital, date_format='%Y-%m-%d %H:%M',
+                            periods_per_year=bars_per_year(interval))
+            
+            if result is None:
+                return jsonify({"error": "No historical data available for the specified period"}), 400
+        
+        elif result is None:
+            # Fetch historical data (local when the warm-up job has it)
+            history = load_history(symbol, start_date, end_date)
+            
+            if history.empty:
+                return jsonify({"error": "No historical data available for the specified period"}), 400
+            
+            result = (simulate_rules if use_kernel else simulate)(history, parameters, initial_capital)
+            
+            if result is None:
+                return jsonify({"error": "No historical data available for the specified period"}), 400
+        
+        if reusable:
+            backtest_cache.put(input_hash, result)
+        
+        final_capital = result['final_capital']
+        profit_loss = result['profit_loss']
+        profit_loss_percent = result['profit_loss_percent']
+        max_drawdown = result['max_drawdown']
+        sharpe_ratio = result['sharpe_ratio']
+        trades = result['trades']
+        equity_data = result['equity_curve']
         
         # Create backtest record
         backtest = Backtest(
@@ -181,15 +161,20 @@ def run_backtest():
             sharpe_ratio=sharpe_ratio,
             trades_data=trades,
             equity_curve=equity_data,
-            strategy_id=strategy.id
+            strategy_id=strategy.id,
+            input_hash=input_hash if reusable else None
         )
         
         db.session.add(backtest)
         db.session.commit()
+        response_cache.invalidate(user_id, 'backtests')
         
         return jsonify({
             "message": "Backtest completed successfully",
             "backtest": backtest.to_dict(),
+            "cached": cached,
+            # "rules": long-only bar loop with stops, sizing and costs; "signal": long/short formula
+            "engine": "rules" if use_kernel else "signal",
             "summary": {
                 "initial_capital": initial_capital,
                 "final_capital": final_capital,
@@ -201,5 +186,157 @@ def run_backtest():
             }
         }), 201
         
+    except InvalidRules as e:
+        return jsonify({"error": str(e)}), 400
+    except UpstreamUnavailable as e:
+        return jsonify({"error": f"Market data unavailable: {str(e)}"}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         return jsonify({"error": f"Backtest failed: {str(e)}"}), 500
+
+@backtest_bp.route('/walk-forward', methods=['POST'])
+@jwt_required()
+def run_walk_forward():
+    user_id = get_jwt_identity()
+    data = request.json
+    
+    # Validate required fields
+    if not all(k in data for k in ('strategy_id', 'start_date', 'end_date')):
+        return jsonify({"error": "Missing required fields"}), 400
+    
+    # Verify strategy ownership
+    strategy = Strategy.query.filter_by(id=data['strategy_id'], user_id=user_id).first()
+    
+    if not strategy:
+        return jsonify({"error": "Strategy not found"}), 404
+    
+    try:
+        # Parse dates
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date()
+        
+        if start_date >= end_date:
+            return jsonify({"error": "End date must be after start date"}), 400
+        
+        # Window sizes are in bars
+        train_size = int(data.get('train_size', 252))
+        test_size = int(data.get('test_size', 63))
+        step = int(data.get('step', test_size))
+        
+        if train_size < 2 or test_size < 2 or step < 1:
+            return jsonify({"error": "train_size and test_size must be at least 2 and step at least 1"}), 400
+        
+        parameters = strategy.parameters
+        symbol = parameters.get('symbol', 'SPY')  # Default to SPY if not specified
+        
+        # Fetch the full range once; every window is evaluated from it
+        history = load_history(symbol, start_date, end_date)
+        
+        if history.empty:
+            return jsonify({"error": "No historical data available for the specified period"}), 400
+        
+        windows = walk_forward(history, parameters, train_size, test_size, step)
+        
+        if not windows:
+            return jsonify({"error": "Not enough data for a single train/test window"}), 400
+        
+        return jsonify({
+            "strategy_id": strategy.id,
+            "symbol": symbol,
+            "train_size": train_size,
+            "test_size": test_size,
+            "step": step,
+            "windows": windows
+        }), 200
+        
+    except UpstreamUnavailable as e:
+        return jsonify({"error": f"Market data unavailable: {str(e)}"}), 503, {"Retry-After": str(e.retry_after)}
+    except Exception as e:
+        return jsonify({"error": f"Walk-forward failed: {str(e)}"}), 500
+
+@backtest_bp.route('/monte-carlo', methods=['POST'])
+@jwt_required()
+def run_monte_carlo():
+    user_id = get_jwt_identity()
+    data = request.json
+    
+    try:
+        n_paths = int(data.get('n_paths', 10000))
+        block_size = int(data.get('block_size', 5))
+        confidence = float(data.get('confidence', 0.95))
+        seed = data.get('seed')
+        
+        if not 1 <= n_paths <= MAX_PATHS:
+            return jsonify({"error": f"n_paths must be between 1 and {MAX_PATHS}"}), 400
+        
+        if block_size < 1 or not 0 < confidence < 1:
+            return jsonify({"error": "block_size must be positive and confidence between 0 and 1"}), 400
+        
+        if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int) or seed < 0):
+            return jsonify({"error": "seed must be a non-negative integer"}), 400
+        
+        if 'backtest_id' in data:
+            # Resample the returns of a stored backtest
+            backtest = Backtest.query.get(data['backtest_id'])
+            
+            if not backtest:
+                return jsonify({"error": "Backtest not found"}), 404
+            
+            strategy = Strategy.query.get(backtest.strategy_id)
+            
+            if not strategy or strategy.user_id != user_id:
+                return jsonify({"error": "Unauthorized access"}), 403
+            
+            equity = np.array([point['value'] for point in backtest.equity_curve], dtype=float)
+            returns = equity[1:] / equity[:-1] - 1
+            initial_capital = backtest.initial_capital
+        
+        elif all(k in data for k in ('strategy_id', 'start_date', 'end_date', 'initial_capital')):
+            # Run the strategy over the given period and resample its returns
+            strategy = Strategy.query.filter_by(id=data['strategy_id'], user_id=user_id).first()
+            
+            if not strategy:
+                return jsonify({"error": "Strategy not found"}), 404
+            
+            start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date()
+            initial_capital = float(data['initial_capital'])
+            
+            if start_date >= end_date or initial_capital <= 0:
+                return jsonify({"error": "Invalid date range or initial capital"}), 400
+            
+            symbol = strategy.parameters.get('symbol', 'SPY')
+            history = load_history(symbol, start_date, end_date)
+            
+            if history.empty:
+                return jsonify({"error": "No historical data available for the specified period"}), 400
+            
+            returns = strategy_returns(history, strategy.parameters)
+        
+        else:
+            return jsonify({"error": "Provide backtest_id, or strategy_id with start_date, end_date and initial_capital"}), 400
+        
+        returns = returns[np.isfinite(returns)]
+        
+        if len(returns) < 2:
+            return jsonify({"error": "Not enough returns to resample"}), 400
+        
+        results = bootstrap(
+            returns,
+            initial_capital,
+            n_paths=n_paths,
+            block_size=block_size,
+            seed=seed,
+            confidence=confidence,
+            workers=current_app.config.get('MONTE_CARLO_WORKERS')
+        )
+        
+        return jsonify({
+            "strategy_id": strategy.id,
+            "initial_capital": initial_capital,
+            "results": results
+        }), 200
+        
+    except UpstreamUnavailable as e:
+        return jsonify({"error": f"Market data unavailable: {str(e)}"}), 503, {"Retry-After": str(e.retry_after)}
+    except Exception as e:
+        return jsonify({"error": f"Monte Carlo simulation failed: {str(e)}"}), 500
@@ -1,8 +1,13 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context, current_app
 from flask_jwt_extended import jwt_required
-import yfinance as yf
+from services.history_store import cached_history
+from services.market_data import cached_info, cached_quote
+from services.quote_stream import TooManyStreams, quote_hub
+from services.upstream import UpstreamUnavailable
 import pandas as pd
 from datetime import datetime, timedelta
+import json
+import queue
 
 market_bp = Blueprint('market', __name__)
 
@@ -10,28 +15,57 @@ market_bp = Blueprint('market', __name__)
 @jwt_required()
 def get_quote(symbol):
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
+        # May be the last known quote, flagged "stale", while a refresh runs
+        quote_data, meta = cached_quote(symbol)
         
-        # Extract relevant information
-        quote_data = {
-            'symbol': symbol,
-            'price': info.get('currentPrice', info.get('regularMarketPrice', 0)),
-            'change': info.get('regularMarketChange', 0),
-            'change_percent': info.get('regularMarketChangePercent', 0),
-            'high': info.get('dayHigh', 0),
-            'low': info.get('dayLow', 0),
-            'open': info.get('open', 0),
-            'previous_close': info.get('previousClose', 0),
-            'volume': info.get('volume', 0),
-            'market_cap': info.get('marketCap', 0),
-            'name': info.get('shortName', symbol)
-        }
-        
-        return jsonify(quote_data), 200
+        return jsonify({**quote_data, **meta}), 200
+    except UpstreamUnavailable as e:
+        return jsonify({"error": f"Market data unavailable: {str(e)}"}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         return jsonify({"error": f"Failed to fetch quote: {str(e)}"}), 500
 
+@market_bp.route('/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_quotes():
+    # EventSource cannot set headers, so the token may also come as ?jwt=<token>
+    symbols = [s.strip().upper() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    max_symbols = current_app.config.get('QUOTE_STREAM_MAX_SYMBOLS', 50)
+    
+    if not symbols:
+        return jsonify({"error": "At least one symbol is required"}), 400
+    
+    if len(set(symbols)) > max_symbols:
+        return jsonify({"error": f"At most {max_symbols} symbols can be streamed at once"}), 400
+    
+    keepalive = current_app.config.get('QUOTE_STREAM_KEEPALIVE', 15)
+    try:
+        subscription = quote_hub.subscribe(symbols)
+    except TooManyStreams:
+        # Every open stream holds a server thread; keep some free for regular requests
+        return jsonify({"error": "Too many open quote streams, try again later"}), 503, {"Retry-After": str(keepalive)}
+    
+    def generate():
+        try:
+            while True:
+                try:
+                    event = subscription.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    # Comment lines keep proxies from closing idle connections
+                    yield ': keep-alive\n\n'
+                    continue
+                
+                # Events are shared between subscribers, so build a new payload
+                data = {k: v for k, v in event.items() if k != 'type'}
+                yield f"event: {event['type']}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            quote_hub.unsubscribe(subscription)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @market_bp.route('/history/<symbol>', methods=['GET'])
 @jwt_required()
 def get_history(symbol):
@@ -50,9 +84,8 @@ def get_history(symbol):
         if interval not in valid_intervals:
             return jsonify({"error": f"Invalid interval. Valid options are: {', '.join(valid_intervals)}"}), 400
         
-        # Fetch data
-        ticker = yf.Ticker(symbol)
-        history = ticker.history(period=period, interval=interval)
+        # Fetch data (warm symbols come from the local store; may be flagged "stale" while a refresh runs)
+        history, meta = cached_history(symbol, period, interval)
         
         # Process data for charting
         data = []
@@ -70,8 +103,11 @@ def get_history(symbol):
             'symbol': symbol,
             'period': period,
             'interval': interval,
-            'data': data
+            'data': data,
+            **meta
         }), 200
+    except UpstreamUnavailable as e:
+        return jsonify({"error": f"Market data unavailable: {str(e)}"}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         return jsonify({"error": f"Failed to fetch history: {str(e)}"}), 500
 
@@ -86,16 +122,16 @@ def search_symbols():
         
         # This is a simplified approach - in production, you would use a more comprehensive market data API
         # or maintain your own database of symbols
-        tickers = yf.Tickers([
+        symbols = [
             'AAPL', 'MSFT', 'GOOGL', 'AMZN', 'META', 'TSLA', 'NVDA', 'JPM', 
             'V', 'PG', 'UNH', 'HD', 'BAC', 'XOM', 'DIS', 'NFLX', 'ADBE', 'CRM'
-        ])
+        ]
         
         results = []
-        for ticker in tickers.tickers:
-            symbol = ticker.ticker
+        unavailable = None
+        for symbol in symbols:
             try:
-                info = ticker.info
+                info, _ = cached_info(symbol)
                 name = info.get('shortName', '')
                 
                 if query.upper() in symbol or query.lower() in name.lower():
@@ -105,10 +141,15 @@ def search_symbols():
                         'exchange': info.get('exchange', ''),
                         'type': info.get('quoteType', '')
                     })
+            except UpstreamUnavailable as e:
+                unavailable = e
             except:
                 # Skip tickers that fail to fetch info
                 pass
         
+        if unavailable and not results:
+            return jsonify({"error": f"Market data unavailable: {str(unavailable)}"}), 503, {"Retry-After": str(unavailable.retry_after)}
+        
         return jsonify(results), 200
     except Exception as e:
         return jsonify({"error": f"Search failed: {str(e)}"}), 500
@@ -1,9 +1,19 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models.db import db
-from models.portfolio import Portfolio, Position, Trade
+from models.db import commit_untracked, db, read_only
+from models.portfolio import Portfolio, Position
 from models.user import User
-import yfinance as yf
+from models.order import Order
+from models.serializers import position_dicts, recent_trade_dicts, trade_page
+from services.response_cache import response_cache
+from services.risk import portfolio_risk, returns_cache
+from services.trading import TradeError, place_market_order
+from services.market_data import cached_quote, fetch_quote
+from services.order_book import ORDER_TYPES, is_triggered
+from services.order_manager import ACTIVE_STATUSES, fill_order
+from services.upstream import UpstreamUnavailable
+from datetime import datetime
+import numpy as np
 
 portfolio_bp = Blueprint('portfolio', __name__)
 
@@ -22,21 +32,26 @@ def get_portfolio():
     positions_data = []
     
     for position in positions:
-        # Update current price (in production, this would use a more efficient batch approach)
+        # Update current price; a stale cached quote is fine for valuation
         try:
-            ticker = yf.Ticker(position.symbol)
-            current_price = ticker.info.get('currentPrice', position.current_price)
-            position.current_price = current_price
-            db.session.commit()
+            quote, _ = cached_quote(position.symbol)
+            position.current_price = quote['price'] or position.current_price
         except:
             # If price update fails, use existing price
             pass
         
         positions_data.append(position.to_dict())
     
+    # A price refresh is not the user's own write, so it must not keep their reads off the replicas
+    commit_untracked()
+    
+    # Prices were refreshed above, so cached position lists are out of date. The
+    # next list may come from a lagging replica, which the cache does not store
+    if positions:
+        response_cache.invalidate(user_id, 'positions')
+    
     # Get recent trades
-    trades = Trade.query.filter_by(portfolio_id=portfolio.id).order_by(Trade.executed_at.desc()).limit(10).all()
-    trades_data = [trade.to_dict() for trade in trades]
+    trades_data = recent_trade_dicts(portfolio.id, 10)
     
     return jsonify({
         "portfolio": portfolio.to_dict(),
@@ -46,6 +61,8 @@ def get_portfolio():
 
 @portfolio_bp.route('/positions', methods=['GET'])
 @jwt_required()
+@read_only
+@response_cache.cached('positions')
 def get_positions():
     user_id = get_jwt_identity()
     
@@ -54,14 +71,85 @@ def get_positions():
     if not portfolio:
         return jsonify({"error": "Portfolio not found"}), 404
     
+    return jsonify({
+        "positions": position_dicts(portfolio.id)
+    }), 200
+
+@portfolio_bp.route('/risk', methods=['GET'])
+@jwt_required()
+@read_only
+def get_risk():
+    user_id = get_jwt_identity()
+    
+    portfolio = Portfolio.query.filter_by(user_id=user_id).first()
+    
+    if not portfolio:
+        return jsonify({"error": "Portfolio not found"}), 404
+    
+    confidence = request.args.get('confidence', 0.95, type=float)
+    
+    if not 0 < confidence < 1:
+        return jsonify({"error": "Confidence must be between 0 and 1"}), 400
+    
     positions = Position.query.filter_by(portfolio_id=portfolio.id).all()
     
+    if not positions:
+        return jsonify({"error": "Portfolio has no open positions"}), 400
+    
+    # Weight each holding by its last known market value
+    symbols = [position.symbol for position in positions]
+    values = np.array([position.quantity * position.current_price for position in positions])
+    total_value = values.sum()
+    
+    if total_value <= 0:
+        return jsonify({"error": "Portfolio has no market value"}), 400
+    
+    benchmark = current_app.config.get('RISK_BENCHMARK', 'SPY')
+    
+    try:
+        columns = symbols + ([benchmark] if benchmark not in symbols else [])
+        matrix = returns_cache.returns_matrix(columns)
+        
+        if len(matrix) < 2:
+            return jsonify({"error": "Not enough overlapping price history"}), 400
+        
+        risk = portfolio_risk(
+            matrix[symbols].to_numpy(),
+            values / total_value,
+            matrix[benchmark].to_numpy(),
+            confidence
+        )
+    except UpstreamUnavailable as e:
+        return jsonify({"error": f"Market data unavailable: {str(e)}"}), 503, {"Retry-After": str(e.retry_after)}
+    except Exception as e:
+        return jsonify({"error": f"Risk calculation failed: {str(e)}"}), 500
+    
+    def _number(value):
+        if isinstance(value, int):
+            return value
+        return float(value) if value is not None and np.isfinite(value) else None
+    
+    covariance = risk.pop('covariance')
+    
     return jsonify({
-        "positions": [position.to_dict() for position in positions]
+        "portfolio_id": portfolio.id,
+        "market_value": float(total_value),
+        "benchmark": benchmark,
+        "symbols": symbols,
+        "weights": (values / total_value).tolist(),
+        "covariance": covariance.tolist(),
+        "start_date": matrix.index[0].strftime('%Y-%m-%d'),
+        "end_date": matrix.index[-1].strftime('%Y-%m-%d'),
+        "metrics": {name: _number(value) for name, value in risk.items()},
+        "var_value": {
+            "historical": _number(risk['historical_var'] * total_value),
+            "parametric": _number(risk['parametric_var'] * total_value)
+        }
     }), 200
 
 @portfolio_bp.route('/trades', methods=['GET'])
 @jwt_required()
+@read_only
 def get_trades():
     user_id = get_jwt_identity()
     
@@ -74,14 +162,12 @@ def get_trades():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     
-    trades = Trade.query.filter_by(portfolio_id=portfolio.id) \
-                      .order_by(Trade.executed_at.desc()) \
-                      .paginate(page=page, per_page=per_page)
+    trades, total, pages = trade_page(portfolio.id, page, per_page)
     
     return jsonify({
-        "trades": [trade.to_dict() for trade in trades.items],
-        "total": trades.total,
-        "pages": trades.pages,
+        "trades": trades,
+        "total": total,
+        "pages": pages,
         "page": page
     }), 200
 
@@ -108,79 +194,201 @@ def execute_trade():
     if direction not in ['buy', 'sell']:
         return jsonify({"error": "Direction must be 'buy' or 'sell'"}), 400
     
-    # Get current price
+    # Get current price (never a stale one: trades execute at it)
     try:
-        ticker = yf.Ticker(symbol)
-        price = ticker.info.get('currentPrice', ticker.info.get('regularMarketPrice'))
+        price = fetch_quote(symbol)['price']
         
         if not price:
             return jsonify({"error": "Could not get current price for symbol"}), 400
+    except UpstreamUnavailable as e:
+        return jsonify({"error": f"Market data unavailable: {str(e)}"}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         return jsonify({"error": f"Failed to fetch market data: {str(e)}"}), 500
     
-    # Check if selling existing position
-    if direction == 'sell':
-        position = Position.query.filter_by(portfolio_id=portfolio.id, symbol=symbol).first()
-        
-        if not position or position.quantity < quantity:
-            return jsonify({"error": "Insufficient shares to sell"}), 400
+    try:
+        trade = place_market_order(portfolio, symbol, quantity, direction, price, data.get('strategy_id'))
+    except TradeError as e:
+        return jsonify({"error": str(e)}), 400
     
-    # Check if buying with sufficient funds
-    if direction == 'buy':
-        total_cost = price * quantity
-        
-        if portfolio.current_balance < total_cost:
-            return jsonify({"error": "Insufficient funds"}), 400
+    db.session.commit()
+    response_cache.invalidate(user_id, 'positions')
     
-    # Execute trade
-    trade = Trade(
-        symbol=symbol,
-        quantity=quantity,
-        price=price,
+    return jsonify({
+        "message": "Trade executed successfully",
+        "trade": trade.to_dict(),
+        "portfolio": portfolio.to_dict()
+    }), 201
+
+@portfolio_bp.route('/orders', methods=['GET'])
+@jwt_required()
+@read_only
+def get_orders():
+    user_id = get_jwt_identity()
+    
+    portfolio = Portfolio.query.filter_by(user_id=user_id).first()
+    
+    if not portfolio:
+        return jsonify({"error": "Portfolio not found"}), 404
+    
+    query = Order.query.filter_by(portfolio_id=portfolio.id)
+    
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    
+    orders = query.order_by(Order.created_at.desc()).all()
+    
+    return jsonify({
+        "orders": [order.to_dict() for order in orders]
+    }), 200
+
+@portfolio_bp.route('/orders', methods=['POST'])
+@jwt_required()
+def place_order():
+    user_id = get_jwt_identity()
+    data = request.json
+    
+    # Validate required fields
+    if not all(k in data for k in ('symbol', 'quantity', 'direction', 'order_type')):
+        return jsonify({"error": "Missing required fields"}), 400
+    
+    portfolio = Portfolio.query.filter_by(user_id=user_id).first()
+    
+    if not portfolio:
+        return jsonify({"error": "Portfolio not found"}), 404
+    
+    order_type = data['order_type'].lower()
+    direction = data['direction'].lower()
+    
+    if order_type not in ORDER_TYPES:
+        return jsonify({"error": f"Order type must be one of: {', '.join(ORDER_TYPES)}"}), 400
+    
+    if direction not in ['buy', 'sell']:
+        return jsonify({"error": "Direction must be 'buy' or 'sell'"}), 400
+    
+    try:
+        quantity = float(data['quantity'])
+        limit_price = float(data['limit_price']) if data.get('limit_price') is not None else None
+        stop_price = float(data['stop_price']) if data.get('stop_price') is not None else None
+        expires_at = datetime.fromisoformat(data['expires_at']) if data.get('expires_at') else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid quantity, price or expiry"}), 400
+    
+    if quantity <= 0:
+        return jsonify({"error": "Quantity must be positive"}), 400
+    
+    if order_type in ('limit', 'stop_limit') and not limit_price:
+        return jsonify({"error": "limit_price is required for limit and stop_limit orders"}), 400
+    
+    if order_type in ('stop', 'stop_limit') and not stop_price:
+        return jsonify({"error": "stop_price is required for stop and stop_limit orders"}), 400
+    
+    order = Order(
+        symbol=data['symbol'],
+        order_type=order_type,
         direction=direction,
-        portfolio_id=portfolio.id,
-        strategy_id=data.get('strategy_id')
+        quantity=quantity,
+        limit_price=limit_price,
+        stop_price=stop_price,
+        expires_at=expires_at,
+        portfolio_id=portfolio.id
     )
     
-    # Update portfolio balance
-    if direction == 'buy':
-        portfolio.current_balance -= price * quantity
-    else:
-        portfolio.current_balance += price * quantity
-    
-    # Update or create position
-    position = Position.query.filter_by(portfolio_id=portfolio.id, symbol=symbol).first()
-    
-    if position:
-        if direction == 'buy':
-            # Update average entry price
-            new_total = (position.quantity * position.entry_price) + (quantity * price)
-            position.quantity += quantity
-            position.entry_price = new_total / position.quantity
-            position.current_price = price
-        else:
-            position.quantity -= quantity
-            position.current_price = price
-            
-            # Remove position if quantity is zero
-            if position.quantity <= 0:
-                db.session.delete(position)
-    else:
-        if direction == 'buy':
-            position = Position(
-                symbol=symbol,
-                quantity=quantity,
-                entry_price=price,
-                current_price=price,
-                portfolio_id=portfolio.id
-            )
-            db.session.add(position)
-    
-    db.session.add(trade)
+    db.session.add(order)
     db.session.commit()
     
     return jsonify({
-        "message": "Trade executed successfully",
-        "trade": trade.to_dict(),
-        "portfolio": portfolio.to_dict()
+        "message": "Order placed successfully",
+        "order": order.to_dict()
     }), 201
+
+@portfolio_bp.route('/orders/<int:order_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_order(order_id):
+    user_id = get_jwt_identity()
+    
+    portfolio = Portfolio.query.filter_by(user_id=user_id).first()
+    
+    if not portfolio:
+        return jsonify({"error": "Portfolio not found"}), 404
+    
+    # Only cancel if still resting, even if the order book fills it concurrently
+    cancelled = Order.query.filter(
+        Order.id == order_id,
+        Order.portfolio_id == portfolio.id,
+        Order.status.in_(ACTIVE_STATUSES)
+    ).update({'status': 'cancelled', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    
+    if not cancelled:
+        return jsonify({"error": "Open order not found"}), 404
+    
+    return jsonify({
+        "message": "Order cancelled successfully",
+        "order": Order.query.get(order_id).to_dict()
+    }), 200
+
+@portfolio_bp.route('/orders/<int:order_id>/fill', methods=['POST'])
+@jwt_required()
+def fill_resting_order(order_id):
+    user_id = get_jwt_identity()
+    
+    portfolio = Portfolio.query.filter_by(user_id=user_id).first()
+    
+    if not portfolio:
+        return jsonify({"error": "Portfolio not found"}), 404
+    
+    order = Order.query.filter_by(id=order_id, portfolio_id=portfolio.id).first()
+    
+    if not order or order.status not in ACTIVE_STATUSES:
+        return jsonify({"error": "Open order not found"}), 404
+    
+    # Fill now only if the current price satisfies the order's conditions
+    try:
+        price = fetch_quote(order.symbol)['price']
+        
+        if not price:
+            return jsonify({"error": "Could not get current price for symbol"}), 400
+    except UpstreamUnavailable as e:
+        return jsonify({"error": f"Market data unavailable: {str(e)}"}), 503, {"Retry-After": str(e.retry_after)}
+    except Exception as e:
+        return jsonify({"error": f"Failed to fetch market data: {str(e)}"}), 500
+    
+    if not is_triggered(order.order_type, order.direction, price, order.limit_price,
+                        order.stop_price, order.status == 'triggered'):
+        return jsonify({"error": f"Order conditions not met at current price {price}"}), 400
+    
+    status = fill_order(order, price)
+    
+    if status is None:
+        return jsonify({"error": "Order is no longer open"}), 409
+    
+    if status == 'rejected':
+        return jsonify({"error": "Order rejected: insufficient funds or shares", "order": order.to_dict()}), 400
+    
+    return jsonify({
+        "message": "Order filled successfully",
+        "order": order.to_dict(),
+        "portfolio": Portfolio.query.get(portfolio.id).to_dict()
+    }), 200
+
+@portfolio_bp.route('/orders/expire', methods=['POST'])
+@jwt_required()
+def expire_orders():
+    user_id = get_jwt_identity()
+    
+    portfolio = Portfolio.query.filter_by(user_id=user_id).first()
+    
+    if not portfolio:
+        return jsonify({"error": "Portfolio not found"}), 404
+    
+    expired = Order.query.filter(
+        Order.portfolio_id == portfolio.id,
+        Order.status.in_(ACTIVE_STATUSES),
+        Order.expires_at <= datetime.utcnow()
+    ).update({'status': 'expired', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    
+    return jsonify({
+        "message": "Expired orders updated",
+        "expired": expired
+    }), 200
@@ -1,23 +1,27 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models.db import db
+from models.db import db, read_only
 from models.strategy import Strategy
 from models.user import User
+from models.serializers import strategy_dicts
+from services.response_cache import response_cache
 
 strategy_bp = Blueprint('strategy', __name__)
 
 @strategy_bp.route('/', methods=['GET'])
 @jwt_required()
+@read_only
+@response_cache.cached('strategies')
 def get_strategies():
     user_id = get_jwt_identity()
     
-    strategies = Strategy.query.filter_by(user_id=user_id).all()
     return jsonify({
-        "strategies": [strategy.to_dict() for strategy in strategies]
+        "strategies": strategy_dicts(user_id)
     }), 200
 
 @strategy_bp.route('/<int:strategy_id>', methods=['GET'])
 @jwt_required()
+@read_only
 def get_strategy(strategy_id):
     user_id = get_jwt_identity()
     
@@ -50,6 +54,7 @@ def create_strategy():
     
     db.session.add(strategy)
     db.session.commit()
+    response_cache.invalidate(user_id, 'strategies')
     
     return jsonify({
         "message": "Strategy created successfully",
@@ -80,6 +85,7 @@ def update_strategy(strategy_id):
         strategy.is_active = data['is_active']
     
     db.session.commit()
+    response_cache.invalidate(user_id, 'strategies')
     
     return jsonify({
         "message": "Strategy updated successfully",
@@ -98,6 +104,7 @@ def delete_strategy(strategy_id):
     
     db.session.delete(strategy)
     db.session.commit()
+    response_cache.invalidate(user_id, 'strategies', 'backtests')
     
     return jsonify({
         "message": "Strategy deleted successfully"
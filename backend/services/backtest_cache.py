@@ -0,0 +1,49 @@
+import hashlib
+import json
+
+from services.backtest_engine import ENGINE_VERSION
+from services.cache import LRUCache
+
+
+def backtest_key(parameters, indicators, symbol, start_date, end_date, initial_capital, interval='1d'):
+    """Content hash of every input that can change a backtest's result
+
+    The backtest name is deliberately left out: re-running the same inputs
+    under a new name must map to the same key.
+    """
+    payload = {
+        'parameters': parameters or {},
+        'indicators': indicators or {},
+        'symbol': symbol,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'initial_capital': float(initial_capital),
+        'interval': interval,
+        'engine_version': ENGINE_VERSION
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def result_from_backtest(backtest):
+    """Rebuild an engine result from a stored Backtest record"""
+    return {
+        'final_capital': backtest.final_capital,
+        'profit_loss': backtest.profit_loss,
+        'profit_loss_percent': backtest.profit_loss_percent,
+        'max_drawdown': backtest.max_drawdown,
+        'sharpe_ratio': backtest.sharpe_ratio,
+        'trades': backtest.trades_data,
+        'equity_curve': backtest.equity_curve
+    }
+
+
+class BacktestResultCache(LRUCache):
+    """Bounded in-process tier in front of the input_hash lookup on Backtest"""
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('BACKTEST_CACHE_SIZE', self.maxsize)
+        app.extensions['backtest_cache'] = self
+
+
+backtest_cache = BacktestResultCache()
@@ -0,0 +1,293 @@
+import numpy as np
+
+# Bump whenever a change to this module or to services/bar_kernel.py can alter
+# backtest results, so that memoized results computed by an older engine are not reused
+ENGINE_VERSION = 5
+
+RISK_FREE_RATE = 0.02  # Assume 2% risk-free rate
+PERIODS_PER_YEAR = 252
+
+
+def rolling_mean(values, window):
+    """Trailing mean over `window` values, NaN until the window is full
+
+    Each window is summed left to right in a fixed order, with no running
+    total carried between positions. The result for a bar therefore does not
+    depend on where the input array starts, which is what lets the chunked
+    engine reproduce the in-memory numbers exactly. (A sum over a
+    sliding_window_view is not safe here: NumPy picks the reduction order
+    from the array shape, so short chunks round differently.)
+    """
+    means = np.full(len(values), np.nan)
+    count = len(values) - window + 1
+    if count > 0:
+        sums = values[:count].copy()
+        for offset in range(1, window):
+            sums += values[offset:offset + count]
+        means[window - 1:] = sums / window
+    return means
+
+
+def crossover_signal(short_ma, long_ma):
+    """1 while the short average is above the long one, -1 while below, else 0"""
+    return np.where(short_ma > long_ma, 1.0, np.where(short_ma < long_ma, -1.0, 0.0))
+
+
+class ChunkedBacktest:
+    """Moving average crossover backtest fed one block of bars at a time
+
+    Only O(1) state crosses chunk boundaries: the last long_ma - 1 closes
+    for the rolling means, the previous close and signal, the compounded
+    growth, the running equity peak and worst drawdown, and running sums
+    for the Sharpe ratio. Peak memory is set by the chunk size, not the
+    length of the backtest. All accumulations are strictly sequential
+    (cumprod/cumsum/accumulate), so any chunking gives bit-identical results.
+
+    The equity curve keeps the last bar of each calendar day, which for daily
+    bars is every bar.
+    """
+
+    def __init__(self, parameters, initial_capital, date_format='%Y-%m-%d', periods_per_year=PERIODS_PER_YEAR):
+        self.short_period = parameters.get('short_ma', 20)
+        self.long_period = parameters.get('long_ma', 50)
+        self.initial_capital = initial_capital
+        self.date_format = date_format
+        self.periods_per_year = periods_per_year
+        self.bars = 0
+        self.trades = []
+        self.equity_curve = []
+
+        self._tail = np.empty(0)
+        self._prev_close = np.nan
+        self._prev_signal = np.nan
+        self._position = 0
+        self._growth = 1.0
+        self._equity = np.nan
+        self._peak = np.nan
+        self._worst_drawdown = np.nan
+        self._pending_day = None
+
+        # Sharpe ratio sums, shifted by the first return for numerical stability
+        self._shift = None
+        self._count = 0
+        self._sum = 0.0
+        self._sum_squares = 0.0
+
+    def feed(self, index, close):
+        """Process the next block of bars, given their DatetimeIndex and closes"""
+        close = np.asarray(close, dtype=float)
+        n = len(close)
+        if not n:
+            return
+        self.bars += n
+
+        # Calculate indicators, continuing the rolling windows of the last chunk
+        buffer = np.concatenate([self._tail, close])
+        short_ma = rolling_mean(buffer, self.short_period)[-n:]
+        long_ma = rolling_mean(buffer, self.long_period)[-n:]
+        keep = max(self.short_period, self.long_period) - 1
+        self._tail = buffer[-keep:] if keep else buffer[:0]
+
+        # Generate signals
+        signal = crossover_signal(short_ma, long_ma)
+        prev_signal = np.concatenate([[self._prev_signal], signal[:-1]])
+
+        # Calculate returns
+        prev_close = np.concatenate([[self._prev_close], close[:-1]])
+        returns = close / prev_close - 1
+        strategy_returns = prev_signal * returns
+        self._prev_close = close[-1]
+        self._prev_signal = signal[-1]
+
+        # Calculate equity curve
+        valid = ~np.isnan(strategy_returns)
+        growth = np.cumprod(np.concatenate([[self._growth], np.where(valid, 1 + strategy_returns, 1.0)]))[1:]
+        equity = np.where(valid, growth * self.initial_capital, np.nan)
+        self._growth = growth[-1]
+        self._equity = equity[-1]
+
+        # Track max drawdown
+        peak = np.fmax.accumulate(np.concatenate([[self._peak], equity]))[1:]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            drawdown = (equity - peak) / peak
+        self._peak = peak[-1]
+        self._worst_drawdown = np.fmin.reduce(np.concatenate([[self._worst_drawdown], drawdown]))
+
+        # Accumulate Sharpe ratio sums
+        observed = strategy_returns[valid]
+        if len(observed):
+            if self._shift is None:
+                self._shift = observed[0]
+            deviations = observed - self._shift
+            self._sum = np.cumsum(np.concatenate([[self._sum], deviations]))[-1]
+            self._sum_squares = np.cumsum(np.concatenate([[self._sum_squares], deviations * deviations]))[-1]
+            self._count += len(observed)
+
+        self._record_trades(index, close, signal, prev_signal)
+        self._record_equity(index, equity)
+
+    def _record_trades(self, index, close, signal, prev_signal):
+        # Generate trades
+        for i in np.flatnonzero((signal != prev_signal) & ~np.isnan(prev_signal)):
+            # Signal changed, generate a trade
+            if signal[i] == 1:  # Buy signal
+                price = close[i]
+                shares = self.initial_capital / price
+                self.trades.append({
+                    'date': index[i].strftime(self.date_format),
+                    'type': 'buy',
+                    'price': price,
+                    'shares': shares,
+                    'value': price * shares
+                })
+                self._position = shares
+            elif signal[i] == -1 and self._position > 0:  # Sell signal
+                price = close[i]
+                self.trades.append({
+                    'date': index[i].strftime(self.date_format),
+                    'type': 'sell',
+                    'price': price,
+                    'shares': self._position,
+                    'value': price * self._position
+                })
+                self._position = 0
+
+    def _record_equity(self, index, equity):
+        days = index.normalize().asi8
+        if self._pending_day is not None and self._pending_day[0] != days[0]:
+            self._append_equity(*self._pending_day[1:])
+
+        for i in np.flatnonzero(days[1:] != days[:-1]):
+            self._append_equity(index[i], equity[i])
+        self._pending_day = (days[-1], index[-1], equity[-1])
+
+    def _append_equity(self, date, value):
+        self.equity_curve.append({
+            'date': date.strftime('%Y-%m-%d'),
+            'value': float(value)
+        })
+
+    def finish(self):
+        """Flush buffered output and return the backtest results"""
+        if self._pending_day is not None:
+            self._append_equity(*self._pending_day[1:])
+            self._pending_day = None
+
+        # Calculate performance metrics
+        final_capital = self._equity
+        profit_loss = final_capital - self.initial_capital
+        profit_loss_percent = (profit_loss / self.initial_capital) * 100
+        max_drawdown = self._worst_drawdown * 100
+
+        # Calculate Sharpe ratio (annualized)
+        sharpe_ratio = np.float64(np.nan)
+        if self._count > 1:
+            mean = self._shift + self._sum / self._count
+            variance = max((self._sum_squares - self._sum * self._sum / self._count) / (self._count - 1), 0.0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                sharpe_ratio = ((mean * self.periods_per_year) - RISK_FREE_RATE) / \
+                               (np.sqrt(variance) * np.sqrt(self.periods_per_year))
+
+        return {
+            'final_capital': final_capital,
+            'profit_loss': profit_loss,
+            'profit_loss_percent': profit_loss_percent,
+            'max_drawdown': max_drawdown,
+            'sharpe_ratio': sharpe_ratio,
+            'trades': self.trades,
+            'equity_curve': self.equity_curve
+        }
+
+
+def simulate(history, parameters, initial_capital):
+    """Run the moving average crossover strategy over a price history
+
+    Returns the performance summary together with the generated trades and
+    the equity curve, ready to be stored on a Backtest record.
+    """
+    engine = ChunkedBacktest(parameters, initial_capital)
+    engine.feed(history.index, history['Close'].to_numpy())
+    return engine.finish()
+
+
+def simulate_chunked(chunks, parameters, initial_capital, date_format='%Y-%m-%d', periods_per_year=PERIODS_PER_YEAR):
+    """Run the strategy over an iterable of history DataFrames in time order
+
+    periods_per_year is the number of bars per year, which annualizes the
+    Sharpe ratio. Returns None if the chunks contained no bars at all.
+    """
+    engine = ChunkedBacktest(parameters, initial_capital, date_format, periods_per_year)
+    for chunk in chunks:
+        engine.feed(chunk.index, chunk['Close'].to_numpy())
+    return engine.finish() if engine.bars else None
+
+
+def strategy_returns(history, parameters):
+    """Per-bar strategy returns of the crossover signal, as a NumPy array
+
+    Uses the same indicator and signal definitions as simulate(). The first
+    bar has no return and is dropped, so the result is one element shorter
+    than the history.
+    """
+    close = history['Close'].to_numpy(dtype=float)
+    short_ma = rolling_mean(close, parameters.get('short_ma', 20))
+    long_ma = rolling_mean(close, parameters.get('long_ma', 50))
+
+    signal = crossover_signal(short_ma, long_ma)
+    return signal[:-1] * (close[1:] / close[:-1] - 1)
+
+
+def window_metrics(returns, periods_per_year=PERIODS_PER_YEAR, risk_free_rate=RISK_FREE_RATE):
+    """Return %, Sharpe ratio and max drawdown % for each row of a returns matrix"""
+    growth = np.cumprod(1 + returns, axis=1)
+    total_return = (growth[:, -1] - 1) * 100
+
+    peak = np.maximum.accumulate(growth, axis=1)
+    max_drawdown = ((growth - peak) / peak).min(axis=1) * 100
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe_ratio = ((returns.mean(axis=1) * periods_per_year) - risk_free_rate) / \
+                       (returns.std(axis=1, ddof=1) * np.sqrt(periods_per_year))
+
+    return total_return, sharpe_ratio, max_drawdown
+
+
+def walk_forward(history, parameters, train_size, test_size, step=None):
+    """Evaluate the strategy over rolling in-sample/out-of-sample windows
+
+    Indicators and returns are computed once over the whole history. Each
+    window is then a strided view into that single returns array, so all
+    windows are scored together in one vectorized pass instead of refetching
+    data and recomputing overlapping rolling means per window.
+    """
+    step = step or test_size
+    returns = strategy_returns(history, parameters)
+    dates = history.index[1:]
+    window_size = train_size + test_size
+
+    if len(returns) < window_size:
+        return []
+
+    windows = np.lib.stride_tricks.sliding_window_view(returns, window_size)[::step]
+    starts = np.arange(0, len(returns) - window_size + 1, step)
+
+    in_sample = window_metrics(windows[:, :train_size])
+    out_of_sample = window_metrics(windows[:, train_size:])
+
+    def _metrics(metrics, i):
+        return {
+            name: float(values[i]) if np.isfinite(values[i]) else None
+            for name, values in zip(('return_percent', 'sharpe_ratio', 'max_drawdown'), metrics)
+        }
+
+    results = []
+    for i, start in enumerate(starts):
+        results.append({
+            'train_start': dates[start].strftime('%Y-%m-%d'),
+            'train_end': dates[start + train_size - 1].strftime('%Y-%m-%d'),
+            'test_start': dates[start + train_size].strftime('%Y-%m-%d'),
+            'test_end': dates[start + window_size - 1].strftime('%Y-%m-%d'),
+            'in_sample': _metrics(in_sample, i),
+            'out_of_sample': _metrics(out_of_sample, i)
+        })
+    return results
@@ -0,0 +1,453 @@
+import time
+
+import numpy as np
+
+from services.backtest_engine import PERIODS_PER_YEAR, RISK_FREE_RATE, crossover_signal, rolling_mean
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:  # Optional: without numba the same kernel runs as plain Python
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+# Strategy.parameters keys read by the bar-loop kernel, and the values that leave a rule off
+RULE_DEFAULTS = {
+    'stop_loss': 0.0, 'take_profit': 0.0, 'trailing_stop': 0.0,
+    'position_size': 1.0, 'commission': 0.0, 'commission_rate': 0.0
+}
+RULE_KEYS = tuple(RULE_DEFAULTS)
+
+# Exit reasons as stored in the kernel's trade arrays
+SIGNAL, STOP_LOSS, TRAILING_STOP, TAKE_PROFIT = 0, 1, 2, 3
+REASONS = {SIGNAL: 'signal', STOP_LOSS: 'stop_loss', TRAILING_STOP: 'trailing_stop', TAKE_PROFIT: 'take_profit'}
+
+
+# Slots of the kernel state array, carried from one chunk of bars to the next
+CASH, SHARES, ENTRY_PRICE, HIGH_WATER, PREV_SIGNAL = range(5)
+
+
+class InvalidRules(ValueError):
+    """Rule parameters that cannot be simulated"""
+
+
+def uses_rules(parameters):
+    """Whether a strategy's parameters ask for any path-dependent rule
+
+    Only values that differ from RULE_DEFAULTS count: the kernel is
+    long-only, while the signal formula also holds the short side between a
+    sell and the next buy, so a setting that changes nothing (commission: 0,
+    position_size: 1, ...) must not switch engines. Raises InvalidRules like
+    rule_config().
+    """
+    return rule_config(parameters) != RULE_DEFAULTS
+
+
+def rule_config(parameters):
+    """Validated rule settings from Strategy.parameters
+
+    stop_loss, take_profit and trailing_stop are fractions of the entry
+    price (trailing: of the highest high since entry), 0 or missing to
+    disable. position_size is the fraction of equity put into each entry.
+    commission is a fixed amount per fill and commission_rate a fraction
+    of the filled value.
+    """
+    rules = {}
+    for key, default in RULE_DEFAULTS.items():
+        value = parameters.get(key)
+        try:
+            rules[key] = default if value is None else float(value)
+        except (TypeError, ValueError):
+            raise InvalidRules(f"{key} must be a number")
+        if not np.isfinite(rules[key]) or rules[key] < 0:
+            raise InvalidRules(f"{key} must be a non-negative number")
+
+    if not 0 < rules['position_size'] <= 1:
+        raise InvalidRules("position_size must be in (0, 1]")
+    if rules['stop_loss'] >= 1 or rules['trailing_stop'] >= 1:
+        raise InvalidRules("stop_loss and trailing_stop must be below 1")
+    return rules
+
+
+def initial_state(initial_capital):
+    """Kernel state before the first bar: all cash, no position, no previous signal"""
+    return np.array([float(initial_capital), 0.0, 0.0, 0.0, np.nan])
+
+
+@njit(cache=True)
+def run_kernel(open_, high, low, close, signal, state, position_size,
+               stop_loss, take_profit, trailing_stop, commission, commission_rate):
+    """Long-only bar loop over NumPy arrays; returns equity and the fills
+
+    `state` (see initial_state()) is read at the start and updated in place
+    at the end, so consecutive chunks of one path can be run one after the
+    other with the same results as a single call. Entries and signal exits fill at the close of the bar whose crossover
+    signals them, like the formula engine. While long, each bar is first
+    checked against the protective levels known at its open: a stop (the
+    higher of stop_loss and trailing_stop) fills at its level, or at the
+    open if the bar gaps through it; a take-profit likewise at its target
+    or a better open. When a bar reaches both, the stop is assumed to have
+    filled first.
+    """
+    n = len(close)
+    equity = np.empty(n)
+    fill_bar = np.empty(2 * n, np.int64)
+    fill_side = np.empty(2 * n, np.int64)
+    fill_reason = np.empty(2 * n, np.int64)
+    fill_price = np.empty(2 * n)
+    fill_shares = np.empty(2 * n)
+    fill_fee = np.empty(2 * n)
+    fills = 0
+
+    cash = state[CASH]
+    shares = state[SHARES]
+    entry_price = state[ENTRY_PRICE]
+    high_water = state[HIGH_WATER]
+    previous_signal = state[PREV_SIGNAL]
+    # A position carried in was entered before this chunk's first bar
+    entry_bar = -1
+
+    for i in range(n):
+        if shares > 0:
+            stop_level = -np.inf
+            stop_reason = STOP_LOSS
+            if stop_loss > 0:
+                stop_level = entry_price * (1 - stop_loss)
+            if trailing_stop > 0 and high_water * (1 - trailing_stop) > stop_level:
+                stop_level = high_water * (1 - trailing_stop)
+                stop_reason = TRAILING_STOP
+            target = entry_price * (1 + take_profit) if take_profit > 0 else np.inf
+
+            exit_price = np.nan
+            exit_reason = SIGNAL
+            if low[i] <= stop_level:
+                exit_price = min(open_[i], stop_level)
+                exit_reason = stop_reason
+            elif high[i] >= target:
+                exit_price = max(open_[i], target)
+                exit_reason = TAKE_PROFIT
+
+            if not np.isnan(exit_price):
+                fee = commission + commission_rate * shares * exit_price
+                cash += shares * exit_price - fee
+                fill_bar[fills] = i
+                fill_side[fills] = -1
+                fill_reason[fills] = exit_reason
+                fill_price[fills] = exit_price
+                fill_shares[fills] = shares
+                fill_fee[fills] = fee
+                fills += 1
+                shares = 0.0
+
+        if not np.isnan(previous_signal) and signal[i] != previous_signal:
+            price = close[i]
+            if signal[i] == 1 and shares == 0:
+                budget = cash * position_size
+                quantity = (budget - commission) / (price * (1 + commission_rate))
+                if quantity > 0:
+                    fee = commission + commission_rate * quantity * price
+                    cash -= quantity * price + fee
+                    shares = quantity
+                    entry_price = price
+                    high_water = price
+                    entry_bar = i
+                    fill_bar[fills] = i
+                    fill_side[fills] = 1
+                    fill_reason[fills] = SIGNAL
+                    fill_price[fills] = price
+                    fill_shares[fills] = quantity
+                    fill_fee[fills] = fee
+                    fills += 1
+            elif signal[i] == -1 and shares > 0:
+                fee = commission + commission_rate * shares * price
+                cash += shares * price - fee
+                fill_bar[fills] = i
+                fill_side[fills] = -1
+                fill_reason[fills] = SIGNAL
+                fill_price[fills] = price
+                fill_shares[fills] = shares
+                fill_fee[fills] = fee
+                fills += 1
+                shares = 0.0
+
+        # The entry bar's range happened before the fill, so it does not raise the trail
+        if shares > 0 and i > entry_bar and high[i] > high_water:
+            high_water = high[i]
+
+        equity[i] = cash + shares * close[i]
+        previous_signal = signal[i]
+
+    state[CASH] = cash
+    state[SHARES] = shares
+    state[ENTRY_PRICE] = entry_price
+    state[HIGH_WATER] = high_water
+    state[PREV_SIGNAL] = previous_signal
+    return (equity, fill_bar[:fills], fill_side[:fills], fill_reason[:fills],
+            fill_price[:fills], fill_shares[:fills], fill_fee[:fills])
+
+
+def reference_backtest(open_, high, low, close, signal, initial_capital, rules):
+    """Straightforward Python version of run_kernel, kept for cross-checking
+
+    Written independently of the kernel (a position record and a list of
+    candidate stops instead of flat state), so a shared mistake is less
+    likely. Returns (equity, fills) with fills as (bar, side, reason,
+    price, shares, fee) tuples.
+    """
+    cash = initial_capital
+    position = None
+    fills = []
+    equity = []
+
+    def fee(shares, price):
+        return rules['commission'] + rules['commission_rate'] * shares * price
+
+    for i in range(len(close)):
+        if position is not None:
+            stops = []
+            if rules['stop_loss']:
+                stops.append((position['entry'] * (1 - rules['stop_loss']), STOP_LOSS))
+            if rules['trailing_stop']:
+                stops.append((position['peak'] * (1 - rules['trailing_stop']), TRAILING_STOP))
+            stop = max(stops, key=lambda s: s[0]) if stops else None
+            target = position['entry'] * (1 + rules['take_profit']) if rules['take_profit'] else None
+
+            exit_fill = None
+            if stop is not None and low[i] <= stop[0]:
+                exit_fill = (min(open_[i], stop[0]), stop[1])
+            elif target is not None and high[i] >= target:
+                exit_fill = (max(open_[i], target), TAKE_PROFIT)
+
+            if exit_fill is not None:
+                price, reason = exit_fill
+                cost = fee(position['shares'], price)
+                cash += position['shares'] * price - cost
+                fills.append((i, -1, reason, price, position['shares'], cost))
+                position = None
+
+        if i > 0 and signal[i] != signal[i - 1]:
+            price = close[i]
+            if signal[i] == 1 and position is None:
+                budget = cash * rules['position_size']
+                shares = (budget - rules['commission']) / (price * (1 + rules['commission_rate']))
+                if shares > 0:
+                    cost = fee(shares, price)
+                    cash -= shares * price + cost
+                    position = {'shares': shares, 'entry': price, 'peak': price, 'bar': i}
+                    fills.append((i, 1, SIGNAL, price, shares, cost))
+            elif signal[i] == -1 and position is not None:
+                cost = fee(position['shares'], price)
+                cash += position['shares'] * price - cost
+                fills.append((i, -1, SIGNAL, price, position['shares'], cost))
+                position = None
+
+        if position is not None and i > position['bar']:
+            position['peak'] = max(position['peak'], high[i])
+
+        equity.append(cash + (position['shares'] * close[i] if position is not None else 0.0))
+
+    return np.array(equity), fills
+
+
+def prepare_bars(history, parameters):
+    """OHLC arrays and the crossover signal for a history, skipping incomplete bars"""
+    frame = history[['Open', 'High', 'Low', 'Close']].dropna()
+    bars = [frame[column].to_numpy(dtype=float) for column in ('Open', 'High', 'Low', 'Close')]
+    close = bars[3]
+    short_ma = rolling_mean(close, parameters.get('short_ma', 20))
+    long_ma = rolling_mean(close, parameters.get('long_ma', 50))
+    return frame.index, bars, crossover_signal(short_ma, long_ma)
+
+
+class ChunkedRulesBacktest:
+    """Rule-kernel backtest fed one block of bars at a time
+
+    The counterpart of backtest_engine.ChunkedBacktest for the bar-loop
+    kernel. Only O(1) state crosses chunk boundaries: the kernel state
+    (cash, shares, entry price, high-water mark, previous signal), the last
+    long_ma - 1 closes for the rolling means, the previous equity, the
+    running equity peak and worst drawdown, and running sums for the Sharpe
+    ratio. Every accumulation is sequential, so any chunking gives
+    bit-identical results.
+
+    The equity curve keeps the last bar of each calendar day.
+    """
+
+    def __init__(self, parameters, initial_capital, date_format='%Y-%m-%d', periods_per_year=PERIODS_PER_YEAR):
+        self.rules = rule_config(parameters)
+        self.short_period = parameters.get('short_ma', 20)
+        self.long_period = parameters.get('long_ma', 50)
+        self.initial_capital = initial_capital
+        self.date_format = date_format
+        self.periods_per_year = periods_per_year
+        self.bars = 0
+        self.trades = []
+        self.equity_curve = []
+
+        self._state = initial_state(initial_capital)
+        self._tail = np.empty(0)
+        self._prev_equity = np.nan
+        self._peak = np.nan
+        self._worst_drawdown = np.nan
+        self._pending_day = None
+
+        # Sharpe ratio sums, shifted by the first return for numerical stability
+        self._shift = None
+        self._count = 0
+        self._sum = 0.0
+        self._sum_squares = 0.0
+
+    def feed(self, history):
+        """Process the next block of bars, given as an OHLC DataFrame"""
+        frame = history[['Open', 'High', 'Low', 'Close']].dropna()
+        n = len(frame)
+        if not n:
+            return
+        self.bars += n
+        index = frame.index
+        open_, high, low, close = (frame[column].to_numpy(dtype=float) for column in ('Open', 'High', 'Low', 'Close'))
+
+        # Continue the rolling windows of the last chunk
+        buffer = np.concatenate([self._tail, close])
+        short_ma = rolling_mean(buffer, self.short_period)[-n:]
+        long_ma = rolling_mean(buffer, self.long_period)[-n:]
+        keep = max(self.short_period, self.long_period) - 1
+        self._tail = buffer[-keep:] if keep else buffer[:0]
+        signal = crossover_signal(short_ma, long_ma)
+
+        rules = self.rules
+        equity, bar, side, reason, price, shares, fee = run_kernel(
+            open_, high, low, close, signal, self._state, rules['position_size'], rules['stop_loss'],
+            rules['take_profit'], rules['trailing_stop'], rules['commission'], rules['commission_rate']
+        )
+
+        self.trades.extend({
+            'date': index[bar[k]].strftime(self.date_format),
+            'type': 'buy' if side[k] == 1 else 'sell',
+            'price': float(price[k]),
+            'shares': float(shares[k]),
+            'value': float(price[k] * shares[k]),
+            'fee': float(fee[k]),
+            'reason': REASONS[int(reason[k])]
+        } for k in range(len(bar)))
+
+        # Track max drawdown
+        peak = np.fmax.accumulate(np.concatenate([[self._peak], equity]))[1:]
+        self._peak = peak[-1]
+        self._worst_drawdown = np.fmin.reduce(np.concatenate([[self._worst_drawdown], (equity - peak) / peak]))
+
+        # Accumulate Sharpe ratio sums over bar-to-bar equity returns
+        returns = equity / np.concatenate([[self._prev_equity], equity[:-1]]) - 1
+        returns = returns[~np.isnan(returns)]
+        self._prev_equity = equity[-1]
+        if len(returns):
+            if self._shift is None:
+                self._shift = returns[0]
+            deviations = returns - self._shift
+            self._sum = np.cumsum(np.concatenate([[self._sum], deviations]))[-1]
+            self._sum_squares = np.cumsum(np.concatenate([[self._sum_squares], deviations * deviations]))[-1]
+            self._count += len(returns)
+
+        self._record_equity(index, equity)
+
+    def _record_equity(self, index, equity):
+        days = index.normalize().asi8
+        if self._pending_day is not None and self._pending_day[0] != days[0]:
+            self._append_equity(*self._pending_day[1:])
+
+        for i in np.flatnonzero(days[1:] != days[:-1]):
+            self._append_equity(index[i], equity[i])
+        self._pending_day = (days[-1], index[-1], equity[-1])
+
+    def _append_equity(self, date, value):
+        self.equity_curve.append({
+            'date': date.strftime('%Y-%m-%d'),
+            'value': float(value)
+        })
+
+    def finish(self):
+        """Flush buffered output and return the backtest results"""
+        if self._pending_day is not None:
+            self._append_equity(*self._pending_day[1:])
+            self._pending_day = None
+
+        sharpe_ratio = np.float64(np.nan)
+        if self._count > 1:
+            mean = self._shift + self._sum / self._count
+            variance = max((self._sum_squares - self._sum * self._sum / self._count) / (self._count - 1), 0.0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                sharpe_ratio = ((mean * self.periods_per_year) - RISK_FREE_RATE) / \
+                               (np.sqrt(variance) * np.sqrt(self.periods_per_year))
+
+        final_capital = float(self._prev_equity)
+        profit_loss = final_capital - self.initial_capital
+        return {
+            'final_capital': final_capital,
+            'profit_loss': profit_loss,
+            'profit_loss_percent': (profit_loss / self.initial_capital) * 100,
+            'max_drawdown': float(self._worst_drawdown) * 100,
+            'sharpe_ratio': sharpe_ratio,
+            'trades': self.trades,
+            'equity_curve': self.equity_curve
+        }
+
+
+def simulate_rules(history, parameters, initial_capital, date_format='%Y-%m-%d', periods_per_year=PERIODS_PER_YEAR):
+    """Backtest the crossover strategy with stops, sizing and costs from its parameters
+
+    Returns the same fields as backtest_engine.simulate(), with a fee and an
+    exit reason on every trade, or None if the history has no complete bars.
+    """
+    return simulate_rules_chunked([history], parameters, initial_capital, date_format, periods_per_year)
+
+
+def simulate_rules_chunked(chunks, parameters, initial_capital, date_format='%Y-%m-%d',
+                           periods_per_year=PERIODS_PER_YEAR):
+    """simulate_rules() over an iterable of history DataFrames in time order
+
+    Memory stays bounded by the chunk size however long the range; returns
+    None if the chunks contained no complete bars.
+    """
+    engine = ChunkedRulesBacktest(parameters, initial_capital, date_format, periods_per_year)
+    for chunk in chunks:
+        engine.feed(chunk)
+    return engine.finish() if engine.bars else None
+
+
+def cross_check(history, parameters, initial_capital, rtol=1e-9):
+    """Run the kernel and the reference on the same bars and compare them
+
+    Returns a summary with the kernel's and the reference's run times and
+    whether equity and fills agree to `rtol`.
+    """
+    rules = rule_config(parameters)
+    _, (open_, high, low, close), signal = prepare_bars(history, parameters)
+
+    started = time.perf_counter()
+    equity, *fill_arrays = run_kernel(
+        open_, high, low, close, signal, initial_state(initial_capital), rules['position_size'], rules['stop_loss'],
+        rules['take_profit'], rules['trailing_stop'], rules['commission'], rules['commission_rate']
+    )
+    kernel_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    reference_equity, reference_fills = reference_backtest(open_, high, low, close, signal, float(initial_capital), rules)
+    reference_seconds = time.perf_counter() - started
+
+    fills = list(zip(*(array.tolist() for array in fill_arrays)))
+    fills_match = len(fills) == len(reference_fills) and all(
+        a[:3] == b[:3] and np.allclose(a[3:], b[3:], rtol=rtol, atol=0)
+        for a, b in zip(fills, reference_fills)
+    )
+    return {
+        'bars': len(close),
+        'fills': len(fills),
+        'match': bool(fills_match and np.allclose(equity, reference_equity, rtol=rtol, atol=0)),
+        'max_equity_difference': float(np.max(np.abs(equity - reference_equity))) if len(close) else 0.0,
+        'kernel_seconds': kernel_seconds,
+        'reference_seconds': reference_seconds
+    }
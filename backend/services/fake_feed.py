@@ -0,0 +1,109 @@
+import random
+import threading
+import time
+
+import pandas as pd
+
+# Bar spacing for each supported history interval
+BAR_FREQUENCIES = {
+    '1m': '1min', '2m': '2min', '5m': '5min', '15m': '15min', '30m': '30min',
+    '60m': '60min', '90m': '90min', '1h': '60min', '1d': '1D'
+}
+
+
+class FakeFeedError(Exception):
+    """Simulated upstream failure"""
+
+
+class FakePriceFeed:
+    """Local random-walk price feed for development and dry runs
+
+    Produces quotes in the same shape as services.market_data.fetch_quote,
+    so it can be swapped in wherever an upstream fetch function is expected.
+    Each call can be slowed down by `latency` seconds (jittered by +/-50%)
+    and fail with probability `error_rate`; setting `down` fails every call,
+    like a provider outage.
+    """
+
+    def __init__(self, seed=0, start_price=100.0, volatility=0.001, latency=0.0, error_rate=0.0):
+        self.seed = seed
+        self.start_price = start_price
+        self.volatility = volatility
+        self.latency = latency
+        self.error_rate = error_rate
+        self.down = False
+        self._rng = random.Random(seed)
+        self._faults = random.Random(seed + 1)
+        self._prices = {}
+        self._volumes = {}
+        self._ranges = {}
+        self._bars = {}
+        self._lock = threading.Lock()
+
+    def set_price(self, symbol, price):
+        """Pin the next quote for a symbol to an exact price"""
+        with self._lock:
+            self._prices[symbol] = float(price)
+
+    def _simulate(self):
+        with self._lock:
+            delay = self.latency * self._faults.uniform(0.5, 1.5) if self.latency else 0.0
+            failing = self.down or (self.error_rate > 0 and self._faults.random() < self.error_rate)
+        if delay:
+            time.sleep(delay)
+        if failing:
+            raise FakeFeedError('Simulated upstream failure')
+
+    def quote(self, symbol):
+        """Advance the walk for a symbol by one step and return its quote"""
+        self._simulate()
+        return self._step(symbol)
+
+    def info(self, symbol):
+        """Static symbol info in the shape of the provider's info dict"""
+        self._simulate()
+        return {'symbol': symbol, 'shortName': symbol, 'exchange': 'FAKE', 'quoteType': 'EQUITY'}
+
+    def _step(self, symbol):
+        with self._lock:
+            previous = self._prices.get(symbol, self.start_price)
+            price = round(previous * (1 + self._rng.gauss(0, self.volatility)), 2)
+            self._prices[symbol] = price
+            volume = self._volumes.get(symbol, 0) + self._rng.randint(0, 1000)
+            self._volumes[symbol] = volume
+            low, high = self._ranges.get(symbol, (self.start_price, self.start_price))
+            low, high = min(low, price), max(high, price)
+            self._ranges[symbol] = (low, high)
+
+        change = round(price - self.start_price, 2)
+        return {
+            'symbol': symbol,
+            'price': price,
+            'change': change,
+            'change_percent': round(change / self.start_price * 100, 4),
+            'high': high,
+            'low': low,
+            'open': self.start_price,
+            'previous_close': self.start_price,
+            'volume': volume,
+            'market_cap': 0,
+            'name': symbol
+        }
+
+    def history(self, symbol, interval='1d', bars=300):
+        """Return a growing OHLCV history; each call appends one new bar
+
+        The first call for a symbol and interval seeds `bars` bars, so
+        indicators have enough warm-up data from the very first cycle.
+        """
+        self._simulate()
+        key = (symbol, interval)
+        with self._lock:
+            closes = self._bars.setdefault(key, [])
+        for _ in range(bars if not closes else 1):
+            closes.append(self._step(symbol)['price'])
+
+        index = pd.date_range('2024-01-02', periods=len(closes), freq=BAR_FREQUENCIES.get(interval, '1D'))
+        return pd.DataFrame({
+            'Open': closes, 'High': closes, 'Low': closes, 'Close': closes, 'Volume': 0.0
+        }, index=index)
@@ -0,0 +1,182 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+import numpy as np
+import pandas as pd
+
+from models.db import db
+from models.price_bar import HistorySync, PriceBar
+from services.market_data import fetch_history, history_slices
+from services.upstream import upstream
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Approximate length of the chart periods that can be served from the store
+PERIOD_DAYS = {'1mo': 30, '3mo': 91, '6mo': 182, '1y': 365, '2y': 730, '5y': 1826}
+
+
+def overlap(interval):
+    """How far back a refresh re-reads, so bars still forming when stored get replaced"""
+    return timedelta(days=3) if interval == '1d' else timedelta(hours=2)
+
+
+def _to_utc(value, tz):
+    # Naive request dates are exchange-local, as they are for the provider
+    ts = pd.Timestamp(value)
+    if tz and ts.tzinfo is None:
+        ts = ts.tz_localize(tz, ambiguous=False, nonexistent='shift_forward')
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert('UTC').tz_localize(None)
+    return ts.to_pydatetime()
+
+
+def _from_utc(value, tz):
+    ts = pd.Timestamp(value)
+    if tz:
+        ts = ts.tz_localize('UTC').tz_convert(tz).tz_localize(None)
+    return ts.to_pydatetime()
+
+
+def store_bars(sync, frame):
+    """Upsert a provider DataFrame into price_bars for a sync row; returns the bar count"""
+    frame = frame.dropna(subset=['Open', 'High', 'Low', 'Close'])
+    if frame.empty:
+        return 0
+
+    index = frame.index
+    if index.tz is not None:
+        sync.timezone = str(index.tz)
+        index = index.tz_convert('UTC').tz_localize(None)
+    timestamps = index.to_pydatetime()
+
+    # Replace rather than merge, so refreshed bars win over ones stored while still forming
+    PriceBar.query.filter(
+        PriceBar.symbol == sync.symbol,
+        PriceBar.interval == sync.interval,
+        PriceBar.timestamp.between(min(timestamps), max(timestamps))
+    ).delete(synchronize_session=False)
+
+    values = frame[COLUMNS].fillna({'Volume': 0}).itertuples(index=False)
+    db.session.execute(db.insert(PriceBar), [
+        {
+            'symbol': sync.symbol,
+            'interval': sync.interval,
+            'timestamp': timestamp,
+            'open': float(bar.Open),
+            'high': float(bar.High),
+            'low': float(bar.Low),
+            'close': float(bar.Close),
+            'volume': float(bar.Volume)
+        }
+        for timestamp, bar in zip(timestamps, values)
+    ])
+    return len(frame)
+
+
+def basis_changed(sync, frame, rtol=1e-4):
+    """Whether re-read bars disagree with the stored ones, as after a split or dividend
+
+    The provider adjusts every past price for corporate actions, so once
+    one happens all stored bars are on the old basis. The latest stored bar
+    is left out, as it may have been stored while still forming.
+    """
+    frame = frame.dropna(subset=['Close'])
+    if frame.empty:
+        return False
+
+    index = frame.index
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    fetched = pd.Series(frame['Close'].to_numpy(dtype=float), index=index)
+
+    rows = db.session.query(PriceBar.timestamp, PriceBar.close).filter(
+        PriceBar.symbol == sync.symbol,
+        PriceBar.interval == sync.interval,
+        PriceBar.timestamp.between(index.min().to_pydatetime(), index.max().to_pydatetime())
+    ).order_by(PriceBar.timestamp).all()[:-1]
+    stored = pd.Series([row[1] for row in rows], index=pd.DatetimeIndex([row[0] for row in rows]), dtype=float)
+
+    common = stored.index.intersection(fetched.index)
+    return not np.allclose(stored[common], fetched[common], rtol=rtol)
+
+
+def load_bars(symbol, interval, start, end, tz=None):
+    """Stored bars with UTC timestamps in [start, end), indexed in the exchange timezone"""
+    rows = db.session.query(
+        PriceBar.timestamp, PriceBar.open, PriceBar.high, PriceBar.low, PriceBar.close, PriceBar.volume
+    ).filter(
+        PriceBar.symbol == symbol,
+        PriceBar.interval == interval,
+        PriceBar.timestamp >= start,
+        PriceBar.timestamp < end
+    ).order_by(PriceBar.timestamp).all()
+
+    index = pd.DatetimeIndex([row[0] for row in rows])
+    if tz:
+        index = index.tz_localize('UTC').tz_convert(tz)
+    return pd.DataFrame([row[1:] for row in rows], columns=COLUMNS, index=index)
+
+
+def _warm_sync(symbol, interval):
+    sync = HistorySync.query.filter_by(symbol=symbol, interval=interval).first()
+    return sync if sync is not None and sync.covered_to is not None else None
+
+
+def load_history(symbol, start, end=None, interval='1d'):
+    """OHLCV history for [start, end), read locally wherever the warm-up job covered it
+
+    Ranges starting inside the stored coverage are served from price_bars;
+    only bars past its end (plus an overlap) are fetched from upstream, and
+    are not stored. Anything else goes to the provider as before.
+    """
+    sync = _warm_sync(symbol, interval)
+    if sync is None:
+        return fetch_history(symbol, start=start, end=end, interval=interval)
+
+    tz = sync.timezone
+    start_utc = _to_utc(start, tz)
+    end_utc = _to_utc(end, tz) if end is not None else datetime.utcnow()
+    if not sync.covered_from <= start_utc < sync.covered_to:
+        return fetch_history(symbol, start=start, end=end, interval=interval)
+
+    history = load_bars(symbol, interval, start_utc, min(end_utc, sync.covered_to), tz)
+    if end_utc > sync.covered_to:
+        tail_start = max(start_utc, sync.covered_to - overlap(interval))
+        tail = fetch_history(symbol, start=_from_utc(tail_start, tz), end=end, interval=interval)
+        if not tail.empty:
+            history = pd.concat([history, tail[COLUMNS]])
+            history = history[~history.index.duplicated(keep='last')].sort_index()
+    return history
+
+
+def iter_history(symbol, start, end, interval='1d'):
+    """Yield history for [start, end) as consecutive DataFrames, one date slice at a time
+
+    Long intraday ranges never have to be held in memory at once, and each
+    slice is read locally when the warm-up job covered it.
+    """
+    for cursor, stop in history_slices(start, end, interval):
+        history = load_history(symbol, cursor, stop, interval)
+        if not history.empty:
+            yield history
+
+
+def period_history(symbol, period, interval='1d'):
+    """History for a chart period, from the store when the symbol is warm"""
+    days = PERIOD_DAYS.get(period)
+    if days is None or _warm_sync(symbol, interval) is None:
+        return fetch_history(symbol, period=period, interval=interval)
+    # Aware, so it is not taken for an exchange-local time like a naive request date
+    return load_history(symbol, pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=days), None, interval)
+
+
+def cached_history(symbol, period, interval='1d'):
+    """period_history() and its staleness metadata, served stale while it refreshes"""
+    app = current_app._get_current_object()
+
+    # Refreshes may run on a background thread, which needs its own app context
+    def _fetch():
+        with app.app_context():
+            return period_history(symbol, period, interval)
+
+    return upstream.cached(('history', symbol, period, interval), _fetch, upstream.ttls['history'])
@@ -0,0 +1,160 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as dt_time, timedelta
+import logging
+import time
+
+from models.db import db
+from models.price_bar import HistorySync, PriceBar
+from models.strategy import Strategy
+from services.history_store import basis_changed, overlap, store_bars
+from services.market_data import INTRADAY_INTERVALS, fetch_history, history_slices
+
+logger = logging.getLogger(__name__)
+
+
+def parse_window(window):
+    """Parse "HH:MM-HH:MM" (UTC) into a pair of times; empty means always open"""
+    if not window:
+        return None
+    start, end = (dt_time.fromisoformat(part.strip()) for part in window.split('-'))
+    return start, end
+
+
+def in_window(window, now=None):
+    """Whether `now` (UTC) falls inside a parsed window, which may wrap midnight"""
+    if window is None:
+        return True
+    current = (now or datetime.utcnow()).time()
+    start, end = window
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+def strategy_universe(watchlist=()):
+    """(symbol, interval) pairs referenced by any strategy, plus the watchlist
+
+    Every symbol gets daily bars; strategies trading an intraday interval
+    also get that interval.
+    """
+    pairs = {(symbol, '1d') for symbol in watchlist}
+    for (parameters,) in db.session.query(Strategy.parameters):
+        parameters = parameters or {}
+        symbol = parameters.get('symbol', 'SPY')
+        pairs.add((symbol, '1d'))
+        if parameters.get('interval') in INTRADAY_INTERVALS:
+            pairs.add((symbol, parameters['interval']))
+    return sorted(pairs)
+
+
+class HistoryWarmer:
+    """Download and refresh history for the strategy universe into price_bars
+
+    Each (symbol, interval) is synced slice by slice, oldest first, and its
+    HistorySync row is advanced after every committed slice, so a run cut
+    short (by an error, a restart or the end of the off-peak window)
+    resumes where it stopped. A refresh whose re-read bars no longer match
+    the stored ones, as after a split or dividend, downloads the whole
+    lookback again. At most `concurrency` symbols download at
+    once; every request still goes through the shared upstream guard.
+    """
+
+    def __init__(self, app, watchlist=(), concurrency=2, daily_days=3650, intraday_days=59,
+                 window=None, fetch=None):
+        self.app = app
+        self.watchlist = list(watchlist)
+        self.concurrency = concurrency
+        self.daily_days = daily_days
+        self.intraday_days = intraday_days
+        self.window = window
+        self.fetch = fetch or fetch_history
+
+    def lookback(self, interval):
+        """How much history to keep for an interval, within what the provider serves"""
+        if interval == '1d':
+            return timedelta(days=self.daily_days)
+        if interval == '1m':
+            return timedelta(days=min(self.intraday_days, 29))
+        return timedelta(days=self.intraday_days)
+
+    def run(self, ignore_window=False):
+        """Sync every pair of the universe once and return a summary"""
+        started = time.perf_counter()
+        with self.app.app_context():
+            pairs = strategy_universe(self.watchlist)
+
+        def _sync(pair):
+            with self.app.app_context():
+                return self.sync(*pair, ignore_window=ignore_window)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = list(executor.map(_sync, pairs))
+
+        return {
+            'pairs': len(pairs),
+            'bars': sum(bars for bars, _ in results),
+            'complete': sum(1 for _, complete in results if complete),
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+
+    def sync(self, symbol, interval, ignore_window=False):
+        """Bring one symbol and interval up to date; returns (bars stored, finished)"""
+        sync = HistorySync.query.filter_by(symbol=symbol, interval=interval).first()
+        if sync is None:
+            sync = HistorySync(symbol=symbol, interval=interval)
+            db.session.add(sync)
+
+        now = datetime.utcnow()
+        oldest = now - self.lookback(interval)
+        start = oldest
+        if sync.covered_to is not None:
+            start = max(oldest, sync.covered_to - overlap(interval))
+        if sync.covered_to is None or start > sync.covered_to:
+            # Nothing stored yet, or a gap too old to fill: coverage restarts here
+            sync.covered_from, sync.covered_to = start, None
+        refresh = sync.covered_to is not None
+
+        stored = 0
+        try:
+            for cursor, stop in history_slices(start, now, interval):
+                if not ignore_window and not in_window(self.window):
+                    db.session.commit()
+                    return stored, False
+                frame = self.fetch(symbol, start=cursor, end=stop, interval=interval)
+                if refresh and basis_changed(sync, frame):
+                    # Prices were adjusted since they were stored: download everything again
+                    logger.info('History for %s (%s) was adjusted upstream, downloading it again', symbol, interval)
+                    PriceBar.query.filter_by(symbol=symbol, interval=interval).delete(synchronize_session=False)
+                    sync.covered_from, sync.covered_to = None, None
+                    db.session.commit()
+                    return self.sync(symbol, interval, ignore_window=ignore_window)
+                refresh = False
+                stored += store_bars(sync, frame)
+                sync.covered_to = max(sync.covered_to or stop, stop)
+                sync.synced_at = datetime.utcnow()
+                sync.error = None
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning('History sync for %s (%s) stopped: %s', symbol, interval, e)
+            HistorySync.query.filter_by(symbol=symbol, interval=interval) \
+                             .update({'error': str(e)[:255]}, synchronize_session=False)
+            db.session.commit()
+            return stored, False
+
+        # Intraday bars past the lookback are no longer served by the provider either
+        if interval != '1d':
+            PriceBar.query.filter(
+                PriceBar.symbol == symbol, PriceBar.interval == interval, PriceBar.timestamp < oldest
+            ).delete(synchronize_session=False)
+            sync.covered_from = max(sync.covered_from, oldest)
+            db.session.commit()
+        return stored, True
+
+    def run_forever(self, interval_seconds=3600):
+        """Run a sync pass every interval_seconds while inside the off-peak window"""
+        while True:
+            started = time.monotonic()
+            if in_window(self.window):
+                logger.info('History warm-up: %s', self.run())
+            time.sleep(max(0.0, interval_seconds - (time.monotonic() - started)))
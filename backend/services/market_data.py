@@ -0,0 +1,137 @@
+import yfinance as yf
+import pandas as pd
+from datetime import timedelta
+
+from services.upstream import upstream
+
+INTRADAY_INTERVALS = ['1m', '2m', '5m', '15m', '30m', '60m', '90m', '1h']
+
+# Time covered by one bar of each provider interval
+BAR_LENGTHS = {
+    '1m': timedelta(minutes=1), '2m': timedelta(minutes=2), '5m': timedelta(minutes=5),
+    '15m': timedelta(minutes=15), '30m': timedelta(minutes=30), '60m': timedelta(hours=1),
+    '90m': timedelta(minutes=90), '1h': timedelta(hours=1), '1d': timedelta(days=1),
+    '5d': timedelta(days=5), '1wk': timedelta(weeks=1)
+}
+
+# Length of the regular US session, the only one intraday bars cover
+SESSION = timedelta(hours=6, minutes=30)
+TRADING_DAYS_PER_YEAR = 252
+
+
+def bars_per_year(interval):
+    """How many bars of an interval a year of regular sessions holds, for annualizing"""
+    if interval not in INTRADAY_INTERVALS:
+        return TRADING_DAYS_PER_YEAR
+    # A session that is not a whole number of bars ends with a shorter one
+    return TRADING_DAYS_PER_YEAR * -(-SESSION // BAR_LENGTHS[interval])
+
+# Local feed (e.g. FakePriceFeed) used instead of yfinance, see use_feed()
+_feed = None
+
+
+def use_feed(feed):
+    """Serve quotes, history and symbol info from a local feed instead of yfinance"""
+    global _feed
+    _feed = feed
+
+
+def _quote(symbol):
+    if _feed is not None:
+        return _feed.quote(symbol)
+
+    info = yf.Ticker(symbol).info
+
+    # Extract relevant information
+    return {
+        'symbol': symbol,
+        'price': info.get('currentPrice', info.get('regularMarketPrice', 0)),
+        'change': info.get('regularMarketChange', 0),
+        'change_percent': info.get('regularMarketChangePercent', 0),
+        'high': info.get('dayHigh', 0),
+        'low': info.get('dayLow', 0),
+        'open': info.get('open', 0),
+        'previous_close': info.get('previousClose', 0),
+        'volume': info.get('volume', 0),
+        'market_cap': info.get('marketCap', 0),
+        'name': info.get('shortName', symbol)
+    }
+
+
+def _info(symbol):
+    if _feed is not None:
+        return _feed.info(symbol)
+    return yf.Ticker(symbol).info
+
+
+def _as_index_time(value, index):
+    # Make a range bound comparable with the feed's index, naive or not
+    ts = pd.Timestamp(value)
+    if index.tz is None and ts.tzinfo is not None:
+        return ts.tz_convert('UTC').tz_localize(None)
+    if index.tz is not None and ts.tzinfo is None:
+        return ts.tz_localize(index.tz)
+    return ts
+
+
+def _history(symbol, start, end, period, interval):
+    if _feed is not None:
+        # The local feed only walks forward, so clip its series to the range
+        history = _feed.history(symbol, interval)
+        if start is not None:
+            history = history[history.index >= _as_index_time(start, history.index)]
+        if end is not None:
+            history = history[history.index < _as_index_time(end, history.index)]
+        return history
+
+    ticker = yf.Ticker(symbol)
+    if period is not None:
+        return ticker.history(period=period, interval=interval)
+    return ticker.history(start=start, end=end, interval=interval)
+
+
+def fetch_quote(symbol):
+    """Fetch a quote snapshot for a symbol from the upstream provider"""
+    return upstream.call(_quote, symbol)
+
+
+def poll_quote(symbol):
+    """fetch_quote() for background pollers, behind interactive calls for rate limit tokens"""
+    return upstream.poll(_quote, symbol)
+
+
+def fetch_info(symbol):
+    """Fetch the provider's raw info dict (name, exchange, ...) for a symbol"""
+    return upstream.call(_info, symbol)
+
+
+def fetch_history(symbol, start=None, end=None, period=None, interval='1d'):
+    """Fetch OHLCV history for a symbol from the upstream provider"""
+    return upstream.call(_history, symbol, start, end, period, interval)
+
+
+def cached_quote(symbol):
+    """Quote for a symbol and its staleness metadata, served stale while it refreshes"""
+    return upstream.cached(('quote', symbol), lambda: fetch_quote(symbol), upstream.ttls['quote'])
+
+
+def cached_info(symbol):
+    """Symbol info and its staleness metadata, served stale while it refreshes"""
+    return upstream.cached(('info', symbol), lambda: fetch_info(symbol), upstream.ttls['info'])
+
+
+def history_slices(start, end, interval='1d', chunk_days=None):
+    """Split [start, end) into consecutive (start, end) date slices
+
+    Slices default to the largest span the provider serves per request for
+    the interval.
+    """
+    if chunk_days is None:
+        chunk_days = 7 if interval == '1m' else 59 if interval in INTRADAY_INTERVALS else 3650
+
+    cursor = start
+    while cursor < end:
+        stop = min(cursor + timedelta(days=chunk_days), end)
+        yield cursor, stop
+        cursor = stop
+
@@ -0,0 +1,101 @@
+from concurrent.futures import ThreadPoolExecutor
+import math
+
+import numpy as np
+
+from services.backtest_engine import window_metrics
+
+MAX_PATHS = 100000
+
+# Peak working memory per resampled return while a chunk is scored, as measured with
+# tracemalloc: the float64 paths plus the cumulative growth, running peak and drawdown
+# temporaries of window_metrics() (the gather indices are freed before scoring)
+BYTES_PER_ELEMENT = 32
+
+# Working memory allowed per chunk, whatever the path count or length. A run peaks at
+# about this much per worker thread
+CHUNK_BYTES = 32 * 2**20
+MAX_CHUNK_ELEMENTS = CHUNK_BYTES // BYTES_PER_ELEMENT
+
+# Chunks scored at once when the caller does not say
+DEFAULT_WORKERS = 4
+
+# Below this many paths the thread pool costs more than it saves
+PARALLEL_THRESHOLD = 20000
+
+
+def _simulate_chunk(returns, n_paths, block_size, seed_sequence, initial_capital):
+    """Resample n_paths circular block-bootstrap paths and score each one"""
+    rng = np.random.default_rng(seed_sequence)
+    length = len(returns)
+    n_blocks = math.ceil(length / block_size)
+
+    # Each path is n_blocks contiguous runs of returns, wrapping at the end
+    starts = rng.integers(0, length, size=(n_paths, n_blocks))
+    indices = (starts[:, :, None] + np.arange(block_size)) % length
+    paths = returns[indices.reshape(n_paths, -1)[:, :length]]
+    # Free the gather indices before scoring, which needs several path-sized temporaries
+    del starts, indices
+
+    total_return, sharpe_ratio, max_drawdown = window_metrics(paths)
+    final_capital = initial_capital * (1 + total_return / 100)
+    return final_capital, sharpe_ratio, max_drawdown
+
+
+def bootstrap(returns, initial_capital, n_paths=10000, block_size=5, seed=None,
+              confidence=0.95, workers=None):
+    """Block-bootstrap a return series and summarise the outcome distribution
+
+    Paths are generated in chunks of at most CHUNK_BYTES of working memory,
+    at most `workers` of them at a time (DEFAULT_WORKERS if None), so a run
+    peaks at about workers * CHUNK_BYTES however many paths it asks for. Every chunk draws from its own child of one seeded
+    SeedSequence, so a given seed yields the same result whether chunks run
+    sequentially or on a thread pool (NumPy releases the GIL in the heavy
+    gather and accumulate loops).
+    """
+    returns = np.asarray(returns, dtype=float)
+    returns = returns[np.isfinite(returns)]
+    block_size = min(block_size, len(returns))
+
+    chunk_size = max(1, min(n_paths, MAX_CHUNK_ELEMENTS // max(len(returns), 1)))
+    chunk_sizes = [chunk_size] * (n_paths // chunk_size)
+    if n_paths % chunk_size:
+        chunk_sizes.append(n_paths % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+    jobs = [(returns, size, block_size, child, initial_capital)
+            for size, child in zip(chunk_sizes, seeds)]
+
+    workers = workers or DEFAULT_WORKERS
+    if n_paths >= PARALLEL_THRESHOLD and len(jobs) > 1 and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda job: _simulate_chunk(*job), jobs))
+    else:
+        results = [_simulate_chunk(*job) for job in jobs]
+
+    final_capital, sharpe_ratio, max_drawdown = (np.concatenate(parts) for parts in zip(*results))
+
+    tail = (1 - confidence) / 2 * 100
+
+    def _summary(values):
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return None
+        lower, median, upper = np.percentile(values, [tail, 50, 100 - tail])
+        return {
+            'mean': float(values.mean()),
+            'median': float(median),
+            'lower': float(lower),
+            'upper': float(upper)
+        }
+
+    return {
+        'n_paths': n_paths,
+        'block_size': block_size,
+        'confidence': confidence,
+        'seed': seed,
+        'final_capital': _summary(final_capital),
+        'sharpe_ratio': _summary(sharpe_ratio),
+        'max_drawdown': _summary(max_drawdown),
+        'probability_of_loss': float((final_capital < initial_capital).mean())
+    }
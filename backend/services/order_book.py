@@ -0,0 +1,168 @@
+from collections import defaultdict
+import heapq
+import itertools
+
+ORDER_TYPES = ('limit', 'stop', 'stop_limit')
+
+
+def is_triggered(order_type, direction, price, limit_price=None, stop_price=None, triggered=False):
+    """Whether a resting order would fill at `price`
+
+    A buy limit fills at or below its limit and a sell limit at or above it.
+    A buy stop fires at or above its stop and a sell stop at or below it.
+    A stop-limit needs its stop crossed (now or earlier, `triggered`) and
+    then its limit satisfied.
+    """
+    if order_type in ('stop', 'stop_limit') and not triggered:
+        crossed = price >= stop_price if direction == 'buy' else price <= stop_price
+        if not crossed:
+            return False
+        if order_type == 'stop':
+            return True
+    return price <= limit_price if direction == 'buy' else price >= limit_price
+
+
+class _SymbolBook:
+    """Four trigger-price heaps for one symbol
+
+    Every heap is keyed so that its root is the order that fires first as
+    the price moves toward it: buy limits by highest limit, sell limits by
+    lowest limit, buy stops by lowest stop and sell stops by highest stop.
+    Ties keep time priority through a sequence number.
+    """
+
+    def __init__(self):
+        self.buy_limits = []
+        self.sell_limits = []
+        self.buy_stops = []
+        self.sell_stops = []
+
+
+class OrderBook:
+    """In-memory index of resting orders, ordered by trigger price per symbol
+
+    A price update only pops the orders whose threshold it crossed, so its
+    cost depends on the number of orders that fire, not on how many are
+    resting. Cancelled or filled orders are removed lazily: they are
+    dropped from the lookup table at once and skipped when they surface at
+    the root of a heap.
+    """
+
+    def __init__(self):
+        self._books = defaultdict(_SymbolBook)
+        self._orders = {}
+        self._expiries = []
+        self._sequence = itertools.count()
+        self._removed = 0
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __contains__(self, order_id):
+        return order_id in self._orders
+
+    def ids(self):
+        """Ids of every resting order"""
+        return set(self._orders)
+
+    def symbols(self):
+        """Symbols that have at least one resting order"""
+        return {order[0] for order in self._orders.values()}
+
+    def add(self, order_id, symbol, order_type, direction, limit_price=None, stop_price=None,
+            expires_at=None, triggered=False):
+        """Index a resting order; `expires_at` may be any comparable timestamp"""
+        if order_type not in ORDER_TYPES:
+            raise ValueError(f"Unknown order type: {order_type}")
+        if order_id in self._orders:
+            return
+
+        self._orders[order_id] = (symbol, order_type, direction, limit_price)
+        book = self._books[symbol]
+        sequence = next(self._sequence)
+
+        if order_type == 'limit' or triggered:
+            self._push_limit(book, direction, limit_price, sequence, order_id)
+        elif direction == 'buy':
+            heapq.heappush(book.buy_stops, (stop_price, sequence, order_id))
+        else:
+            heapq.heappush(book.sell_stops, (-stop_price, sequence, order_id))
+
+        if expires_at is not None:
+            heapq.heappush(self._expiries, (expires_at, sequence, order_id))
+
+    def remove(self, order_id):
+        """Forget an order (cancelled, filled elsewhere, ...); unknown ids are ignored"""
+        if self._orders.pop(order_id, None) is None:
+            return
+
+        # Rebuild the heaps once dead entries outnumber live orders
+        self._removed += 1
+        if self._removed > max(1024, len(self._orders)):
+            self._compact()
+
+    def _compact(self):
+        for book in self._books.values():
+            for heap in (book.buy_limits, book.sell_limits, book.buy_stops, book.sell_stops):
+                heap[:] = [entry for entry in heap if entry[2] in self._orders]
+                heapq.heapify(heap)
+        self._expiries = [entry for entry in self._expiries if entry[2] in self._orders]
+        heapq.heapify(self._expiries)
+        self._removed = 0
+
+    @staticmethod
+    def _push_limit(book, direction, limit_price, sequence, order_id):
+        if direction == 'buy':
+            heapq.heappush(book.buy_limits, (-limit_price, sequence, order_id))
+        else:
+            heapq.heappush(book.sell_limits, (limit_price, sequence, order_id))
+
+    def _pop_crossed(self, heap, crossed):
+        while heap and crossed(heap[0][0]):
+            _, _, order_id = heapq.heappop(heap)
+            if order_id in self._orders:
+                yield order_id
+
+    def on_price(self, symbol, price):
+        """Apply a price update and return the (order_id, event) pairs it causes
+
+        Events are "fill" for orders to execute now and "trigger" for
+        stop-limit orders whose stop was crossed and which now rest as
+        limit orders. Filled orders leave the book.
+        """
+        book = self._books.get(symbol)
+        if book is None:
+            return []
+
+        events = []
+
+        # Stops first, so that a stop-limit triggered by this price can also fill on it
+        fired = list(self._pop_crossed(book.buy_stops, lambda stop: stop <= price))
+        fired += self._pop_crossed(book.sell_stops, lambda stop: -stop >= price)
+        for order_id in fired:
+            _, order_type, direction, limit_price = self._orders[order_id]
+            if order_type == 'stop':
+                events.append((order_id, 'fill'))
+                del self._orders[order_id]
+            else:
+                events.append((order_id, 'trigger'))
+                self._push_limit(book, direction, limit_price, next(self._sequence), order_id)
+
+        for order_id in self._pop_crossed(book.buy_limits, lambda limit: -limit >= price):
+            events.append((order_id, 'fill'))
+            del self._orders[order_id]
+        for order_id in self._pop_crossed(book.sell_limits, lambda limit: limit <= price):
+            events.append((order_id, 'fill'))
+            del self._orders[order_id]
+
+        return events
+
+    def expire(self, now):
+        """Remove and return the ids of resting orders that expired at or before `now`"""
+        expired = []
+        while self._expiries and self._expiries[0][0] <= now:
+            _, _, order_id = heapq.heappop(self._expiries)
+            if order_id in self._orders:
+                del self._orders[order_id]
+                expired.append(order_id)
+        return expired
@@ -0,0 +1,168 @@
+from datetime import datetime
+import logging
+import queue
+import time
+
+from models.db import db, mark_written
+from models.order import Order
+from models.portfolio import Portfolio
+from services.order_book import OrderBook
+from services.response_cache import response_cache
+from services.trading import TradeError, place_market_order
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('open', 'triggered')
+
+
+def fill_order(order, price):
+    """Execute a resting order at `price` through the market order logic
+
+    The order is claimed with a conditional update, so a concurrent cancel
+    or fill wins cleanly and nothing is traded twice. Returns the order's
+    new status ("filled" or "rejected"), or None if it was no longer active.
+    """
+    portfolio = Portfolio.query.get(order.portfolio_id)
+    now = datetime.utcnow()
+
+    try:
+        trade = place_market_order(portfolio, order.symbol, order.quantity, order.direction, price)
+        db.session.flush()
+        values = {'status': 'filled', 'fill_price': price, 'filled_at': now, 'trade_id': trade.id, 'updated_at': now}
+    except TradeError as e:
+        logger.info('Order %s rejected: %s', order.id, e)
+        values = {'status': 'rejected', 'updated_at': now}
+
+    claimed = Order.query.filter(Order.id == order.id, Order.status.in_(ACTIVE_STATUSES)) \
+                         .update(values, synchronize_session=False)
+    if not claimed:
+        db.session.rollback()
+        return None
+
+    db.session.commit()
+    db.session.refresh(order)
+    if order.status == 'filled':
+        mark_written(portfolio.user_id)
+        response_cache.invalidate(portfolio.user_id, 'positions')
+    return order.status
+
+
+class OrderManager:
+    """Keeps an OrderBook in step with the orders table and executes what it fires
+
+    Orders are created and cancelled by the API in the web workers. sync()
+    compares the book with the ids of every active order, indexing the new
+    ones and dropping the ones closed elsewhere, so a single process can own
+    the in-memory index. Comparing ids rather than tracking a high-water
+    mark means an order committed late, out of id order, is never missed.
+    """
+
+    # Orders loaded per query when indexing new ids
+    LOAD_CHUNK = 500
+
+    def __init__(self, app):
+        self.app = app
+        self.book = OrderBook()
+
+    def _index(self, order):
+        self.book.add(
+            order.id, order.symbol, order.order_type, order.direction,
+            limit_price=order.limit_price, stop_price=order.stop_price,
+            expires_at=order.expires_at, triggered=order.status == 'triggered'
+        )
+
+    def sync(self, hub=None):
+        """Index newly created orders and forget ones closed elsewhere
+
+        With a QuoteHub, new orders are also checked against the last quote
+        of their symbol, so one marketable when placed fills without waiting
+        for the price to move.
+        """
+        added = set()
+        with self.app.app_context():
+            active = {order_id for (order_id,) in db.session.query(Order.id).filter(Order.status.in_(ACTIVE_STATUSES))}
+            indexed = self.book.ids()
+
+            for order_id in indexed - active:
+                self.book.remove(order_id)
+
+            missing = sorted(active - indexed)
+            for i in range(0, len(missing), self.LOAD_CHUNK):
+                chunk = missing[i:i + self.LOAD_CHUNK]
+                for order in Order.query.filter(Order.id.in_(chunk), Order.status.in_(ACTIVE_STATUSES)):
+                    self._index(order)
+                    added.add(order.symbol)
+
+        if hub is None:
+            return
+        # Older orders already saw these prices, so only the new ones can fire
+        for symbol in sorted(added):
+            quote = hub.latest(symbol)
+            if quote and quote.get('price'):
+                self.on_price(symbol, quote['price'])
+
+    def on_price(self, symbol, price):
+        """Trigger and fill the orders crossed by a new price for a symbol"""
+        events = self.book.on_price(symbol, price)
+        if not events:
+            return 0
+
+        filled = 0
+        with self.app.app_context():
+            for order_id, event in events:
+                order = Order.query.get(order_id)
+                if order is None or order.status not in ACTIVE_STATUSES:
+                    continue
+                if event == 'trigger':
+                    Order.query.filter(Order.id == order_id, Order.status == 'open') \
+                               .update({'status': 'triggered', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+                    db.session.commit()
+                elif fill_order(order, price) == 'filled':
+                    filled += 1
+        return filled
+
+    def expire(self):
+        """Mark resting orders past their expiry as expired"""
+        expired = self.book.expire(datetime.utcnow())
+        if expired:
+            with self.app.app_context():
+                Order.query.filter(Order.id.in_(expired), Order.status.in_(ACTIVE_STATUSES)) \
+                           .update({'status': 'expired', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+                db.session.commit()
+        return len(expired)
+
+    def run_forever(self, hub, sync_interval=5.0):
+        """Feed price updates from a QuoteHub into the book until interrupted"""
+        subscription = None
+        symbols = set()
+
+        while True:
+            self.sync(hub)
+            self.expire()
+
+            # Follow the set of symbols that have resting orders
+            if self.book.symbols() != symbols:
+                if subscription is not None:
+                    hub.unsubscribe(subscription)
+                symbols = self.book.symbols()
+                subscription = hub.subscribe(symbols) if symbols else None
+
+            if subscription is None:
+                time.sleep(sync_interval)
+                continue
+
+            deadline = time.monotonic() + sync_interval
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    event = subscription.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+                if event['type'] == 'snapshot':
+                    prices = {symbol: quote.get('price') for symbol, quote in event['quotes'].items()}
+                else:
+                    prices = {event['symbol']: event['changes'].get('price')}
+
+                for symbol, price in prices.items():
+                    if price:
+                        self.on_price(symbol, price)
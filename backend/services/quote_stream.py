@@ -0,0 +1,165 @@
+import logging
+import queue
+import threading
+
+from services.market_data import poll_quote
+from services.upstream import UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """A single client's view of the hub: its symbols and a bounded event queue"""
+
+    def __init__(self, symbols, queue_size):
+        self.symbols = frozenset(symbols)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def drain(self):
+        """Discard every pending event and return how many were dropped"""
+        count = 0
+        while True:
+            try:
+                self.queue.get_nowait()
+                count += 1
+            except queue.Empty:
+                return count
+
+
+class TooManyStreams(Exception):
+    """The hub already serves as many clients as this process allows"""
+
+
+class QuoteHub:
+    """Fan out upstream quotes to streaming clients
+
+    One poller thread runs per subscribed symbol, no matter how many clients
+    watch it. Each poll is diffed against the previous quote and only the
+    changed fields are published. A client whose queue fills up has its
+    backlog replaced by a single full snapshot, so slow consumers cost a
+    bounded amount of memory and never hold up the poller. A symbol's poller
+    stops as soon as its last subscriber leaves. Polls take rate limit
+    tokens behind interactive calls, so many streamed symbols update less
+    often instead of throttling trades and quotes.
+
+    Every streaming client holds a server thread for as long as it is
+    connected, so at most `max_clients` subscriptions (0 = unlimited) are
+    accepted per process.
+    """
+
+    def __init__(self, fetch=None, interval=2.0, queue_size=100, max_clients=0):
+        self.fetch = fetch or poll_quote
+        self.interval = interval
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._clients = set()
+        self._subscribers = {}
+        self._pollers = {}
+        self._latest = {}
+
+    def init_app(self, app):
+        """Read hub settings from the Flask config"""
+        self.interval = app.config.get('QUOTE_POLL_INTERVAL', self.interval)
+        self.queue_size = app.config.get('QUOTE_STREAM_QUEUE_SIZE', self.queue_size)
+        self.max_clients = app.config.get('QUOTE_STREAM_MAX_CLIENTS', self.max_clients)
+        app.extensions['quote_hub'] = self
+
+    def subscribe(self, symbols):
+        """Register a client for the given symbols and return its subscription
+
+        Raises TooManyStreams when max_clients subscriptions are already open.
+        """
+        subscription = Subscription(symbols, self.queue_size)
+        with self._lock:
+            if self.max_clients and len(self._clients) >= self.max_clients:
+                raise TooManyStreams(f'{self.max_clients} quote streams already open')
+            self._clients.add(subscription)
+            for symbol in subscription.symbols:
+                self._subscribers.setdefault(symbol, set()).add(subscription)
+                if symbol not in self._pollers:
+                    stop = threading.Event()
+                    thread = threading.Thread(
+                        target=self._poll, args=(symbol, stop),
+                        name=f'quote-poller-{symbol}', daemon=True
+                    )
+                    self._pollers[symbol] = stop
+                    thread.start()
+            # New clients start from the last known quotes rather than waiting a poll.
+            # Queued before the lock is released, so no newer diff can be overtaken by it;
+            # the queue is still empty, so this cannot block or overflow.
+            snapshot = self._snapshot(subscription.symbols)
+            if snapshot:
+                subscription.queue.put_nowait({'type': 'snapshot', 'quotes': snapshot})
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a client and stop pollers for symbols nobody watches anymore"""
+        with self._lock:
+            self._clients.discard(subscription)
+            for symbol in subscription.symbols:
+                subscribers = self._subscribers.get(symbol)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[symbol]
+                    self._pollers.pop(symbol).set()
+                    self._latest.pop(symbol, None)
+
+    def latest(self, symbol):
+        """Last quote polled for a symbol, or None if it is not being polled yet"""
+        with self._lock:
+            return self._latest.get(symbol)
+
+    def active_symbols(self):
+        """Symbols that currently have a running poller"""
+        with self._lock:
+            return sorted(self._pollers)
+
+    def _snapshot(self, symbols):
+        return {symbol: self._latest[symbol] for symbol in symbols if symbol in self._latest}
+
+    def _poll(self, symbol, stop):
+        previous = {}
+        while not stop.is_set():
+            try:
+                quote = self.fetch(symbol)
+            except UpstreamUnavailable as e:
+                # Throttled behind interactive calls or the provider is down: retry next interval
+                logger.debug('Quote poll skipped for %s: %s', symbol, e)
+                quote = None
+            except Exception:
+                logger.exception('Quote poll failed for %s', symbol)
+                quote = None
+
+            if quote is not None:
+                changes = {k: v for k, v in quote.items() if previous.get(k) != v}
+                if changes:
+                    previous = quote
+                    with self._lock:
+                        if stop.is_set():
+                            return
+                        self._latest[symbol] = quote
+                        subscribers = list(self._subscribers.get(symbol, ()))
+                    event = {'type': 'quote', 'symbol': symbol, 'changes': changes}
+                    for subscription in subscribers:
+                        self._deliver(subscription, event)
+
+            stop.wait(self.interval)
+
+    def _deliver(self, subscription, event):
+        with subscription.lock:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # Diffs are useless once one is lost, so resync the client instead
+                subscription.dropped += subscription.drain()
+                with self._lock:
+                    snapshot = self._snapshot(subscription.symbols)
+                subscription.queue.put_nowait({'type': 'snapshot', 'quotes': snapshot})
+
+
+quote_hub = QuoteHub()
@@ -0,0 +1,144 @@
+from functools import wraps
+import hashlib
+import threading
+import time
+
+from flask import current_app, g, request
+from flask_jwt_extended import get_jwt_identity
+
+from services.cache import LRUCache
+
+
+class LocalBackend:
+    """In-process LRU store; only correct while a single worker serves the app
+
+    Entries expire `ttl` seconds after they are set, like they do in Redis.
+    """
+
+    def __init__(self, maxsize=1024):
+        self._entries = LRUCache(maxsize)
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        # With nothing stored locally there is nothing another process could leave stale
+        return self._entries.maxsize <= 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self._entries.pop(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl):
+        self._entries.put(key, (value, time.monotonic() + ttl))
+
+    def generation(self, key):
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def bump(self, key):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+
+class RedisBackend:
+    """Redis store shared by every worker, so invalidations are seen everywhere"""
+
+    shared = True
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RESPONSE_CACHE_URL requires the 'redis' package") from e
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl):
+        self._client.set(key, value, ex=ttl)
+
+    def generation(self, key):
+        return int(self._client.get(key) or 0)
+
+    def bump(self, key):
+        self._client.incr(key)
+
+
+class ResponseCache:
+    """Per-user cache of serialized GET responses with strong ETags
+
+    Each (namespace, user) pair has a generation counter that is part of
+    every cache key. Write handlers call invalidate(), which bumps the
+    counter, so the user's earlier entries are never read again and simply
+    age out of the store. Clients that send If-None-Match get a 304 while
+    their data is unchanged.
+    """
+
+    def __init__(self):
+        self.backend = LocalBackend()
+        self.ttl = 300
+
+    def init_app(self, app):
+        url = app.config.get('RESPONSE_CACHE_URL')
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', self.ttl)
+        if url:
+            self.backend = RedisBackend(url)
+        else:
+            self.backend = LocalBackend(app.config.get('RESPONSE_CACHE_SIZE', 1024))
+        app.extensions['response_cache'] = self
+
+    @property
+    def shared(self):
+        """Whether invalidate() called in this process is seen by every other one"""
+        return self.backend.shared
+
+    @staticmethod
+    def _generation_key(namespace, user_id):
+        return f'response-cache:generation:{namespace}:{user_id}'
+
+    def invalidate(self, user_id, *namespaces):
+        """Drop every cached response of the user in the given namespaces"""
+        for namespace in namespaces:
+            self.backend.bump(self._generation_key(namespace, user_id))
+
+    def cached(self, namespace):
+        """Cache a JWT-protected GET handler's 200 responses per user"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                user_id = get_jwt_identity()
+                generation = self.backend.generation(self._generation_key(namespace, user_id))
+                key = f'response-cache:{namespace}:{user_id}:{generation}:{request.full_path}'
+
+                entry = self.backend.get(key)
+                if entry is not None:
+                    etag, body = entry.split(b'\n', 1)
+                    response = current_app.response_class(body, mimetype='application/json')
+                    response.set_etag(etag.decode('ascii'))
+                else:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data()
+                    etag = hashlib.sha256(body).hexdigest()
+                    # A replica may lag behind the write that bumped the generation
+                    if 'db_replica' not in g:
+                        self.backend.set(key, etag.encode('ascii') + b'\n' + body, self.ttl)
+                    response.set_etag(etag)
+
+                # Let clients keep a copy but make them revalidate it every time
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache()
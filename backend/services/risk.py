@@ -0,0 +1,146 @@
+from datetime import timedelta
+from statistics import NormalDist
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.backtest_engine import PERIODS_PER_YEAR, RISK_FREE_RATE
+from services.cache import LRUCache
+from services.market_data import fetch_history
+
+
+class ReturnsCache:
+    """Daily closes per symbol, extended incrementally, plus aligned returns matrices
+
+    Each symbol's history is downloaded in full once. After that, only the
+    bars since its last cached date are fetched, and only when that symbol
+    is older than refresh_seconds. The aligned returns matrix for a set of
+    symbols is rebuilt only when one of its series has actually changed;
+    the most recently used `matrix_cache_size` matrices are kept.
+
+    Downloads run outside the cache-wide lock, under a lock per symbol, so
+    a slow provider only holds up requests for the symbols being fetched.
+    """
+
+    def __init__(self, lookback_days=365, refresh_seconds=3600, matrix_cache_size=128):
+        self.lookback_days = lookback_days
+        self.refresh_seconds = refresh_seconds
+        self._closes = {}
+        self._versions = {}
+        self._fetched_at = {}
+        self._symbol_locks = {}
+        self._matrices = LRUCache(matrix_cache_size)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.lookback_days = app.config.get('RISK_LOOKBACK_DAYS', self.lookback_days)
+        self.refresh_seconds = app.config.get('RISK_REFRESH_SECONDS', self.refresh_seconds)
+        self._matrices = LRUCache(app.config.get('RISK_MATRIX_CACHE_SIZE', self._matrices.maxsize))
+        app.extensions['returns_cache'] = self
+
+    def _download(self, symbol, start):
+        close = fetch_history(symbol, start=start)['Close']
+        if close.index.tz is not None:
+            close.index = close.index.tz_localize(None)
+        # Align symbols from different exchanges on the calendar date
+        close.index = close.index.normalize()
+        return close[~close.index.duplicated(keep='last')]
+
+    def _refresh(self, symbol):
+        with self._lock:
+            symbol_lock = self._symbol_locks.setdefault(symbol, threading.Lock())
+
+        # Concurrent requests for the symbol wait here for a single download
+        with symbol_lock:
+            with self._lock:
+                cached = self._closes.get(symbol)
+                fetched_at = self._fetched_at.get(symbol)
+            now = time.monotonic()
+            if cached is not None and now - fetched_at < self.refresh_seconds:
+                return
+
+            if cached is None or cached.empty:
+                start = (pd.Timestamp.today() - timedelta(days=self.lookback_days)).date()
+                close = self._download(symbol, start)
+            else:
+                # Refetch from the last cached day, since its close may have moved intraday
+                recent = self._download(symbol, cached.index[-1].date())
+                close = pd.concat([cached[cached.index < cached.index[-1]], recent])
+                close = close[close.index >= close.index[-1] - timedelta(days=self.lookback_days)]
+
+            with self._lock:
+                self._fetched_at[symbol] = now
+                if cached is None or not close.equals(cached):
+                    self._closes[symbol] = close
+                    self._versions[symbol] = self._versions.get(symbol, 0) + 1
+
+    def returns_matrix(self, symbols):
+        """Daily returns for the symbols as a (days x symbols) DataFrame on common dates"""
+        symbols = tuple(symbols)
+        for symbol in symbols:
+            self._refresh(symbol)
+
+        with self._lock:
+            versions = tuple(self._versions[symbol] for symbol in symbols)
+            closes = [self._closes[symbol] for symbol in symbols]
+
+        cached = self._matrices.get(symbols)
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+
+        returns = pd.concat(closes, axis=1, join='inner', keys=symbols).sort_index().pct_change().iloc[1:]
+        self._matrices.put(symbols, (versions, returns))
+        return returns
+
+
+def portfolio_risk(returns, weights, benchmark, confidence=0.95):
+    """Risk metrics for a weighted portfolio of daily asset returns
+
+    `returns` is a (days x assets) array, `weights` the portfolio weight of
+    each asset and `benchmark` the benchmark's daily returns on the same
+    days. Loss measures (VaR, CVaR) are returned as positive fractions of
+    portfolio value.
+    """
+    covariance = np.atleast_2d(np.cov(returns, rowvar=False))
+    portfolio = returns @ weights
+    alpha = 1 - confidence
+
+    mean = portfolio.mean()
+    std = portfolio.std(ddof=1)
+    volatility = np.sqrt(weights @ covariance @ weights)
+
+    # Historical VaR/CVaR from the empirical distribution of portfolio returns
+    historical_var = -np.percentile(portfolio, alpha * 100)
+    historical_cvar = -portfolio[portfolio <= -historical_var].mean()
+
+    # Parametric VaR/CVaR assuming normally distributed returns
+    normal = NormalDist()
+    z = normal.inv_cdf(alpha)
+    parametric_var = -(mean + z * std)
+    parametric_cvar = -(mean - std * normal.pdf(z) / alpha)
+
+    benchmark_variance = benchmark.var(ddof=1)
+    beta = np.cov(portfolio, benchmark)[0, 1] / benchmark_variance if benchmark_variance > 0 else None
+
+    downside = np.sqrt(np.mean(np.minimum(portfolio, 0) ** 2))
+    sortino = ((mean * PERIODS_PER_YEAR) - RISK_FREE_RATE) / (downside * np.sqrt(PERIODS_PER_YEAR)) \
+        if downside > 0 else None
+
+    return {
+        'observations': len(portfolio),
+        'confidence': confidence,
+        'covariance': covariance * PERIODS_PER_YEAR,
+        'volatility': volatility * np.sqrt(PERIODS_PER_YEAR),
+        'daily_volatility': volatility,
+        'historical_var': historical_var,
+        'historical_cvar': historical_cvar,
+        'parametric_var': parametric_var,
+        'parametric_cvar': parametric_cvar,
+        'beta': beta,
+        'sortino_ratio': sortino
+    }
+
+
+returns_cache = ReturnsCache()
@@ -0,0 +1,222 @@
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from models.db import db, mark_written
+from models.portfolio import Portfolio, Position, Trade
+from models.strategy import Strategy
+from services.backtest_engine import crossover_signal, rolling_mean
+from services.market_data import BAR_LENGTHS, INTRADAY_INTERVALS, fetch_history
+from services.response_cache import response_cache
+from services.trading import TradeError, place_market_order
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_latest_bars(symbol, interval):
+    """Recent bars from the upstream provider, enough to warm up the indicators"""
+    period = '5d' if interval in INTRADAY_INTERVALS else '1y'
+    return fetch_history(symbol, period=period, interval=interval)
+
+
+def completed_bars(history, interval, now=None):
+    """Drop the last bar while it is still forming
+
+    The provider's latest bar keeps changing until its interval is over, so
+    a crossover seen on it may not survive the close. Daily bars count as
+    forming until the end of their calendar day.
+    """
+    length = BAR_LENGTHS.get(interval)
+    if length is None or history.empty:
+        return history
+    if now is None:
+        now = pd.Timestamp.now(tz=history.index.tz)
+    if history.index[-1] + length > now:
+        return history.iloc[:-1]
+    return history
+
+
+def evaluate_group(close, strategies):
+    """Signal on the last two bars for every strategy trading one symbol
+
+    Each distinct moving average period is computed once for the whole
+    group, over just the period + 1 closes it needs, and with the same
+    rolling_mean() the backtests use. Returns {strategy_id: (previous,
+    current)} signals.
+    """
+    periods = set()
+    for strategy in strategies:
+        periods.add(strategy.parameters.get('short_ma', 20))
+        periods.add(strategy.parameters.get('long_ma', 50))
+
+    means = {period: rolling_mean(close[-(period + 1):], period)[-2:] for period in periods}
+
+    signals = {}
+    for strategy in strategies:
+        short_ma = means[strategy.parameters.get('short_ma', 20)]
+        long_ma = means[strategy.parameters.get('long_ma', 50)]
+        previous, current = crossover_signal(short_ma, long_ma) if len(short_ma) == 2 else (0.0, 0.0)
+        signals[strategy.id] = (previous, current)
+    return signals
+
+
+def bar_close_time(bar_time, interval):
+    """When a bar stops forming, as a naive UTC datetime like Trade.executed_at"""
+    closed_at = pd.Timestamp(bar_time) + BAR_LENGTHS.get(interval, pd.Timedelta(0))
+    if closed_at.tzinfo is not None:
+        closed_at = closed_at.tz_convert('UTC').tz_localize(None)
+    return closed_at.to_pydatetime()
+
+
+def traded_since(strategy_id, closed_at):
+    """Whether the strategy already traded once this bar had closed
+
+    The runner only trades a bar after it has closed, so such a trade was
+    made for this bar, possibly by an earlier run of the process.
+    """
+    return db.session.query(
+        Trade.query.filter(Trade.strategy_id == strategy_id, Trade.executed_at >= closed_at).exists()
+    ).scalar()
+
+
+class StrategyRunner:
+    """Evaluate every active strategy on the latest completed bar and trade on crossovers
+
+    Active strategies are grouped by (symbol, interval), so each symbol's
+    bars are fetched once per cycle however many strategies trade it. Groups
+    are fetched concurrently; evaluation is batched per group. A crossover on
+    the latest completed bar places a market order, at the latest price,
+    through the same logic as POST /api/portfolio/trade, at most once per
+    strategy and bar, also across restarts.
+    """
+
+    def __init__(self, app, fetch_bars=None, concurrency=4, dry_run=False, history_size=100):
+        self.app = app
+        self.fetch_bars = fetch_bars or fetch_latest_bars
+        self.concurrency = concurrency
+        self.dry_run = dry_run
+        self.cycles = deque(maxlen=history_size)
+        self._last_bar = {}
+
+    def run_cycle(self):
+        """Run one fetch/evaluate/order cycle and return its metrics"""
+        started = time.perf_counter()
+        metrics = {'strategies': 0, 'groups': 0, 'orders': 0, 'rejected': 0, 'fetch_errors': 0}
+
+        with self.app.app_context():
+            groups = defaultdict(list)
+            for strategy in Strategy.query.filter_by(is_active=True).all():
+                parameters = strategy.parameters or {}
+                key = (parameters.get('symbol', 'SPY'), parameters.get('interval', '1d'))
+                groups[key].append(strategy)
+            metrics['strategies'] = sum(len(group) for group in groups.values())
+            metrics['groups'] = len(groups)
+
+            # Fetch each symbol's bars once, several groups at a time
+            def _fetch(key):
+                try:
+                    return key, self.fetch_bars(*key)
+                except Exception:
+                    logger.exception('Failed to fetch bars for %s (%s)', *key)
+                    return key, None
+
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                bars = dict(executor.map(_fetch, groups))
+            fetched = time.perf_counter()
+
+            orders = []
+            for key, strategies in groups.items():
+                history = bars[key]
+                if history is None or history.empty:
+                    metrics['fetch_errors'] += 1
+                    continue
+
+                price = float(history['Close'].iloc[-1])
+                completed = completed_bars(history, key[1])
+                if completed.empty:
+                    continue
+
+                close = completed['Close'].to_numpy(dtype=float)
+                bar_time = completed.index[-1]
+                closed_at = bar_close_time(bar_time, key[1])
+                signals = evaluate_group(close, strategies)
+                for strategy in strategies:
+                    previous, current = signals[strategy.id]
+                    if self._last_bar.get(strategy.id) == bar_time:
+                        continue
+                    self._last_bar[strategy.id] = bar_time
+                    if current != previous and current in (1, -1) and not traded_since(strategy.id, closed_at):
+                        orders.append((strategy, key[0], 'buy' if current == 1 else 'sell', price))
+            evaluated = time.perf_counter()
+
+            for strategy, symbol, direction, price in orders:
+                if self._place(strategy, symbol, direction, price):
+                    metrics['orders'] += 1
+                else:
+                    metrics['rejected'] += 1
+
+        finished = time.perf_counter()
+        metrics.update({
+            'fetch_ms': (fetched - started) * 1000,
+            'evaluate_ms': (evaluated - fetched) * 1000,
+            'order_ms': (finished - evaluated) * 1000,
+            'total_ms': (finished - started) * 1000
+        })
+        self.cycles.append(metrics)
+        return metrics
+
+    def _place(self, strategy, symbol, direction, price):
+        portfolio = Portfolio.query.filter_by(user_id=strategy.user_id).first()
+        if not portfolio:
+            return False
+
+        quantity = float(strategy.parameters.get('order_quantity', 1))
+        if direction == 'sell':
+            # Like the backtests, only sell what is actually held
+            position = Position.query.filter_by(portfolio_id=portfolio.id, symbol=symbol).first()
+            if not position:
+                return False
+            quantity = min(quantity, position.quantity)
+
+        if self.dry_run:
+            logger.info('[dry run] strategy %s: %s %s %s @ %.4f', strategy.id, direction, quantity, symbol, price)
+            return True
+
+        try:
+            place_market_order(portfolio, symbol, quantity, direction, price, strategy.id)
+            db.session.commit()
+        except TradeError as e:
+            db.session.rollback()
+            logger.info('Strategy %s order rejected: %s', strategy.id, e)
+            return False
+
+        mark_written(strategy.user_id)
+        response_cache.invalidate(strategy.user_id, 'positions')
+        return True
+
+    def latency_summary(self):
+        """p50/p95/max of total cycle latency over the recent cycles, in ms"""
+        totals = np.array([cycle['total_ms'] for cycle in self.cycles])
+        if not len(totals):
+            return None
+        p50, p95 = np.percentile(totals, [50, 95])
+        return {'cycles': len(totals), 'p50_ms': float(p50), 'p95_ms': float(p95), 'max_ms': float(totals.max())}
+
+    def run_forever(self, interval_seconds=60, summary_every=60):
+        """Run cycles back to back, starting one every interval_seconds
+
+        Latency percentiles over the recent cycles are logged every
+        `summary_every` cycles.
+        """
+        for cycle in itertools.count(1):
+            started = time.monotonic()
+            metrics = self.run_cycle()
+            logger.info('Strategy cycle: %s', metrics)
+            if cycle % summary_every == 0:
+                logger.info('Strategy cycle latency: %s', self.latency_summary())
+            time.sleep(max(0.0, interval_seconds - (time.monotonic() - started)))
@@ -0,0 +1,75 @@
+from models.db import db
+from models.portfolio import Position, Trade
+
+
+class TradeError(Exception):
+    """A market order that cannot be applied to the portfolio"""
+
+
+def place_market_order(portfolio, symbol, quantity, direction, price, strategy_id=None):
+    """Apply a market order at `price` to a portfolio and return the new Trade
+
+    Updates the cash balance and the symbol's position and adds the trade
+    to the session; the caller commits. Raises TradeError when the
+    portfolio cannot cover the order.
+    """
+    # Check if selling existing position
+    if direction == 'sell':
+        position = Position.query.filter_by(portfolio_id=portfolio.id, symbol=symbol).first()
+
+        if not position or position.quantity < quantity:
+            raise TradeError("Insufficient shares to sell")
+
+    # Check if buying with sufficient funds
+    if direction == 'buy':
+        total_cost = price * quantity
+
+        if portfolio.current_balance < total_cost:
+            raise TradeError("Insufficient funds")
+
+    # Execute trade
+    trade = Trade(
+        symbol=symbol,
+        quantity=quantity,
+        price=price,
+        direction=direction,
+        portfolio_id=portfolio.id,
+        strategy_id=strategy_id
+    )
+
+    # Update portfolio balance
+    if direction == 'buy':
+        portfolio.current_balance -= price * quantity
+    else:
+        portfolio.current_balance += price * quantity
+
+    # Update or create position
+    position = Position.query.filter_by(portfolio_id=portfolio.id, symbol=symbol).first()
+
+    if position:
+        if direction == 'buy':
+            # Update average entry price
+            new_total = (position.quantity * position.entry_price) + (quantity * price)
+            position.quantity += quantity
+            position.entry_price = new_total / position.quantity
+            position.current_price = price
+        else:
+            position.quantity -= quantity
+            position.current_price = price
+
+            # Remove position if quantity is zero
+            if position.quantity <= 0:
+                db.session.delete(position)
+    else:
+        if direction == 'buy':
+            position = Position(
+                symbol=symbol,
+                quantity=quantity,
+                entry_price=price,
+                current_price=price,
+                portfolio_id=portfolio.id
+            )
+            db.session.add(position)
+
+    db.session.add(trade)
+    return trade
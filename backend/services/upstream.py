@@ -0,0 +1,266 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime
+import logging
+import math
+import threading
+import time
+
+from services.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(Exception):
+    """The market data provider is throttled, down or too slow to answer"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """Allow `rate` calls per second on average, in bursts of up to `burst`"""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=0.0, reserve=0):
+        """Take a token, waiting up to `timeout` seconds; False if none came free
+
+        A caller passing `reserve` only takes a token while more than that
+        many are left, so callers without one get the tokens first.
+        """
+        if self.rate <= 0:
+            return True
+
+        deadline = self.clock() + timeout
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1 + reserve:
+                    self._tokens -= 1
+                    return True
+                wait = (1 + reserve - self._tokens) / self.rate
+
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return False
+            time.sleep(min(wait, remaining))
+
+
+class CircuitBreaker:
+    """Fail fast after `failure_threshold` consecutive failures
+
+    Once open, calls are refused for `reset_timeout` seconds. After that a
+    single probe call is let through: its success closes the circuit, its
+    failure opens it for another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._probing or self.clock() - self._opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def allow(self):
+        """Whether a call may go to the provider now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._probing and self.clock() - self._opened_at >= self.reset_timeout:
+                self._probing = True
+                return True
+            return False
+
+    def retry_after(self):
+        """Seconds until the next probe is let through"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(0.0, self._opened_at + self.reset_timeout - self.clock())
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+
+
+class UpstreamGuard:
+    """Shared guard around every call to the market data provider
+
+    call() runs a provider function behind a token bucket, a per-call
+    timeout and a circuit breaker, and raises UpstreamUnavailable instead
+    of blocking when the provider is throttled, slow or down. A call that
+    times out keeps its worker thread until the provider returns; once
+    enough have failed the breaker opens and requests stop queueing behind
+    them.
+
+    poll() is call() at a lower priority, for background polling: it
+    leaves `poll_reserve` tokens of the burst to interactive calls and
+    only takes a token when none of them is waiting for one.
+
+    cached() adds stale-while-revalidate on top: a value older than its TTL
+    is still returned, flagged as stale, while a single background refresh
+    fetches a new one.
+    """
+
+    def __init__(self, rate=5.0, burst=10, timeout=10.0, failure_threshold=5, reset_timeout=30.0,
+                 max_workers=16, cache_size=1024, max_stale=3600.0, poll_reserve=5):
+        self.timeout = timeout
+        self.poll_reserve = poll_reserve
+        self.max_stale = max_stale
+        self.ttls = {'quote': 5.0, 'history': 300.0, 'info': 86400.0}
+        self.limiter = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._cache = LRUCache(cache_size)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upstream')
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upstream-refresh')
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Read limits, timeouts and cache lifetimes from the Flask config"""
+        config = app.config
+        self.timeout = config.get('UPSTREAM_TIMEOUT', self.timeout)
+        self.max_stale = config.get('UPSTREAM_MAX_STALE', self.max_stale)
+        self.poll_reserve = config.get('UPSTREAM_POLL_RESERVE', self.poll_reserve)
+        self.ttls = {
+            'quote': config.get('UPSTREAM_QUOTE_TTL', self.ttls['quote']),
+            'history': config.get('UPSTREAM_HISTORY_TTL', self.ttls['history']),
+            'info': config.get('UPSTREAM_INFO_TTL', self.ttls['info'])
+        }
+        self.limiter = TokenBucket(
+            config.get('UPSTREAM_RATE_LIMIT', self.limiter.rate),
+            config.get('UPSTREAM_BURST', self.limiter.burst)
+        )
+        self.breaker = CircuitBreaker(
+            config.get('UPSTREAM_FAILURE_THRESHOLD', self.breaker.failure_threshold),
+            config.get('UPSTREAM_RESET_SECONDS', self.breaker.reset_timeout)
+        )
+        self._cache = LRUCache(config.get('UPSTREAM_CACHE_SIZE', self._cache.maxsize))
+        if 'UPSTREAM_MAX_WORKERS' in config:
+            self._executor = ThreadPoolExecutor(max_workers=config['UPSTREAM_MAX_WORKERS'], thread_name_prefix='upstream')
+        app.extensions['upstream'] = self
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) against the provider under the guard
+
+        Raises UpstreamUnavailable when the circuit is open, no rate limit
+        token frees up within the timeout or the call itself times out.
+        Errors raised by fn are counted as failures and re-raised.
+        """
+        return self._call(0, fn, args, kwargs)
+
+    def poll(self, fn, *args, **kwargs):
+        """call() for background polling, which never takes the reserved tokens"""
+        return self._call(min(self.poll_reserve, max(0, self.limiter.burst - 1)), fn, args, kwargs)
+
+    def _call(self, reserve, fn, args, kwargs):
+        if self.breaker.state == 'open':
+            raise UpstreamUnavailable('circuit open after repeated failures', self.breaker.retry_after())
+
+        started = time.monotonic()
+        if not self.limiter.acquire(self.timeout, reserve):
+            raise UpstreamUnavailable('rate limit exceeded', 1 / self.limiter.rate)
+
+        # Only claim the half-open probe once the call is sure to be made,
+        # otherwise a throttled probe would leave the breaker half open for good
+        if not self.breaker.allow():
+            raise UpstreamUnavailable('circuit open after repeated failures', self.breaker.retry_after())
+
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+            result = future.result(timeout=max(0.0, self.timeout - (time.monotonic() - started)))
+        except FutureTimeout:
+            future.cancel()
+            self.breaker.record_failure()
+            raise UpstreamUnavailable(f'no response within {self.timeout:g}s', self.breaker.retry_after())
+        except Exception:
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success()
+        return result
+
+    def cached(self, key, fetch, ttl):
+        """Return (value, meta) for `key`, serving the last known value while it refreshes
+
+        Values younger than `ttl` are returned as they are. Older ones, up
+        to `ttl + max_stale`, are returned with "stale" set and refreshed in
+        the background. Past that, or on a miss, fetch() runs inline; if it
+        fails, a stale value is still preferred over an error.
+        """
+        entry = self._cache.get(key)
+        if entry is not None:
+            value, fetched_at, as_of = entry
+            age = time.monotonic() - fetched_at
+            if age < ttl:
+                return value, self._meta(as_of, age, False)
+            if age < ttl + self.max_stale:
+                self._refresh_later(key, fetch)
+                return value, self._meta(as_of, age, True)
+
+        try:
+            value, _, as_of = self._store(key, fetch)
+        except Exception:
+            if entry is None:
+                raise
+            logger.warning('Serving stale %s after failed refresh', key, exc_info=True)
+            return entry[0], self._meta(entry[2], time.monotonic() - entry[1], True)
+        return value, self._meta(as_of, 0.0, False)
+
+    def _store(self, key, fetch):
+        entry = (fetch(), time.monotonic(), datetime.utcnow())
+        self._cache.put(key, entry)
+        return entry
+
+    def _refresh_later(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def _refresh():
+            try:
+                self._store(key, fetch)
+            except Exception as e:
+                logger.warning('Background refresh of %s failed: %s', key, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresher.submit(_refresh)
+
+    @staticmethod
+    def _meta(as_of, age, stale):
+        return {'stale': stale, 'as_of': as_of.isoformat(), 'age_seconds': round(age, 3)}
+
+
+upstream = UpstreamGuard()
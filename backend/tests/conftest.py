@@ -0,0 +1,23 @@
+import os
+import sys
+
+# Tests import the backend modules the way app.py does, from the backend directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask import Flask
+
+
+@pytest.fixture
+def app():
+    """Bare Flask app with every model on an in-memory SQLite database"""
+    from models.db import db
+    import models.backtest, models.order, models.portfolio, models.price_bar, models.strategy, models.user  # noqa: F401
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
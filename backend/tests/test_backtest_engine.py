@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.backtest_engine import simulate, simulate_chunked
+from services.market_data import bars_per_year
+
+PARAMETERS = {'short_ma': 5, 'long_ma': 20}
+
+
+@pytest.fixture(scope='module')
+def history():
+    rng = np.random.default_rng(7)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 5000)))
+    index = pd.date_range('2024-01-02 09:30', periods=len(close), freq='5min')
+    return pd.DataFrame({'Close': close}, index=index)
+
+
+@pytest.mark.parametrize('size', [1, 7, 333, 5000])
+def test_chunked_run_is_identical(history, size):
+    whole = simulate(history, PARAMETERS, 10000.0)
+    chunks = (history.iloc[start:start + size] for start in range(0, len(history), size))
+    chunked = simulate_chunked(chunks, PARAMETERS, 10000.0)
+
+    assert chunked['trades'] == whole['trades']
+    assert chunked['equity_curve'] == whole['equity_curve']
+    for key in ('final_capital', 'max_drawdown', 'sharpe_ratio'):
+        assert chunked[key] == whole[key]
+
+
+def test_sharpe_ratio_is_annualized_per_bar(history, monkeypatch):
+    # Without a risk-free rate the ratio scales with the square root of bars per year
+    monkeypatch.setattr('services.backtest_engine.RISK_FREE_RATE', 0.0)
+    daily = simulate_chunked([history], PARAMETERS, 10000.0)['sharpe_ratio']
+    intraday = simulate_chunked([history], PARAMETERS, 10000.0, periods_per_year=bars_per_year('5m'))['sharpe_ratio']
+    assert intraday / daily == pytest.approx(np.sqrt(78))
+
+
+def test_bars_per_year_counts_regular_session_bars():
+    assert bars_per_year('1d') == 252
+    assert bars_per_year('5m') == 252 * 78
+    assert bars_per_year('60m') == 252 * 7
+    assert bars_per_year('90m') == 252 * 5
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.bar_kernel import InvalidRules, cross_check, simulate_rules, simulate_rules_chunked, uses_rules
+
+PARAMETERS = {'short_ma': 5, 'long_ma': 20}
+
+# Each rule set, and the exit reason it must produce on the test path
+RULE_SETS = [
+    ({}, 'signal'),
+    ({'stop_loss': 0.02}, 'stop_loss'),
+    ({'take_profit': 0.03}, 'take_profit'),
+    ({'trailing_stop': 0.015}, 'trailing_stop'),
+    ({'stop_loss': 0.03, 'take_profit': 0.05, 'trailing_stop': 0.02}, 'trailing_stop'),
+    ({'position_size': 0.5, 'commission': 1.0, 'commission_rate': 0.001}, 'signal'),
+]
+
+
+@pytest.fixture(scope='module')
+def history():
+    # Volatile enough intraday path that stops, targets and trails are all reached
+    rng = np.random.default_rng(42)
+    bars = 5000
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, bars)))
+    open_ = np.concatenate([[100.0], close[:-1]]) * np.exp(rng.normal(0, 0.004, bars))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.006, bars)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.006, bars)))
+    index = pd.date_range('2024-01-02 09:30', periods=bars, freq='5min')
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close}, index=index)
+
+
+@pytest.mark.parametrize('rules, reason', RULE_SETS)
+def test_kernel_matches_reference(history, rules, reason):
+    parameters = {**PARAMETERS, **rules}
+    check = cross_check(history, parameters, 10000.0)
+    assert check['fills'] > 0
+    assert check['match'], check
+
+    # The rule set must actually fire, or the check proves nothing about it
+    reasons = {trade['reason'] for trade in simulate_rules(history, parameters, 10000.0)['trades']}
+    assert reason in reasons
+
+
+@pytest.mark.parametrize('rules, reason', RULE_SETS)
+def test_chunked_run_is_identical(history, rules, reason):
+    parameters = {**PARAMETERS, **rules}
+    whole = simulate_rules(history, parameters, 10000.0)
+    chunks = (history.iloc[start:start + 333] for start in range(0, len(history), 333))
+    chunked = simulate_rules_chunked(chunks, parameters, 10000.0)
+
+    assert chunked['trades'] == whole['trades']
+    assert chunked['equity_curve'] == whole['equity_curve']
+    for key in ('final_capital', 'max_drawdown', 'sharpe_ratio'):
+        assert chunked[key] == whole[key]
+
+
+def test_only_non_default_rules_switch_engines():
+    assert not uses_rules({})
+    assert not uses_rules({'commission': 0, 'position_size': 1, 'stop_loss': None})
+    assert uses_rules({'commission': 1})
+    assert uses_rules({'position_size': 0.5})
+    with pytest.raises(InvalidRules):
+        uses_rules({'stop_loss': 'tight'})
+    with pytest.raises(InvalidRules):
+        uses_rules({'position_size': 2})
+
+
+def test_empty_history_has_no_result():
+    empty = pd.DataFrame(columns=['Open', 'High', 'Low', 'Close'], index=pd.DatetimeIndex([]))
+    assert simulate_rules(empty, PARAMETERS, 10000.0) is None
+    assert simulate_rules_chunked(iter([]), PARAMETERS, 10000.0) is None
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from models.price_bar import HistorySync, PriceBar
+from services.history_warmer import HistoryWarmer
+
+
+class AdjustingFeed:
+    """Daily bars whose whole past is scaled by `factor`, like prices adjusted after a split"""
+
+    def __init__(self):
+        self.factor = 1.0
+        self.last_close = None
+        self.starts = []
+
+    def __call__(self, symbol, start=None, end=None, interval='1d'):
+        self.starts.append(start)
+        index = pd.date_range(end=pd.Timestamp(datetime.utcnow()).normalize(), periods=60, freq='D', tz='UTC')
+        close = (100 + np.arange(len(index), dtype=float)) * self.factor
+        if self.last_close is not None:
+            close[-1] = self.last_close
+        frame = pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close, 'Volume': 1.0}, index=index)
+        return frame[(frame.index >= pd.Timestamp(start, tz='UTC')) & (frame.index < pd.Timestamp(end, tz='UTC'))]
+
+
+def stored_closes():
+    return [bar.close for bar in PriceBar.query.order_by(PriceBar.timestamp)]
+
+
+def test_a_still_forming_bar_does_not_trigger_a_full_download(app):
+    feed = AdjustingFeed()
+    warmer = HistoryWarmer(app, daily_days=30, fetch=feed)
+    warmer.sync('SPY', '1d', ignore_window=True)
+
+    feed.last_close = 1.0
+    feed.starts.clear()
+    warmer.sync('SPY', '1d', ignore_window=True)
+    assert len(feed.starts) == 1
+    assert feed.starts[0] > HistorySync.query.one().covered_from
+
+
+def test_adjusted_history_is_downloaded_again(app):
+    feed = AdjustingFeed()
+    warmer = HistoryWarmer(app, daily_days=30, fetch=feed)
+    warmer.sync('SPY', '1d', ignore_window=True)
+    before = stored_closes()
+
+    feed.factor = 0.5
+    assert warmer.sync('SPY', '1d', ignore_window=True)[1]
+    assert stored_closes() == [close * 0.5 for close in before]
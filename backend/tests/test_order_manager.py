@@ -0,0 +1,44 @@
+from models.db import db
+from models.order import Order
+from models.portfolio import Portfolio
+from models.user import User
+from services.order_manager import OrderManager
+from services.quote_stream import QuoteHub
+
+
+def flat(symbol):
+    return {'symbol': symbol, 'price': 100.0}
+
+
+def test_an_order_marketable_when_placed_fills_on_a_flat_price(app):
+    user = User(username='trader', email='trader@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    portfolio = Portfolio(user_id=user.id, initial_balance=10000.0, current_balance=10000.0)
+    db.session.add(portfolio)
+    db.session.flush()
+    resting = Order(symbol='SPY', order_type='limit', direction='buy', quantity=1, limit_price=90.0,
+                    portfolio_id=portfolio.id)
+    db.session.add(resting)
+    db.session.commit()
+
+    hub = QuoteHub(fetch=flat, interval=60)
+    subscription = hub.subscribe({'SPY'})
+    try:
+        assert subscription.queue.get(timeout=2)['type'] == 'quote'
+        manager = OrderManager(app)
+        manager.sync(hub)
+
+        # Placed after the last price change, and the price never moves again
+        marketable = Order(symbol='SPY', order_type='limit', direction='buy', quantity=1, limit_price=105.0,
+                           portfolio_id=portfolio.id)
+        db.session.add(marketable)
+        db.session.commit()
+        manager.sync(hub)
+    finally:
+        hub.unsubscribe(subscription)
+
+    db.session.expire_all()
+    assert db.session.get(Order, marketable.id).status == 'filled'
+    assert db.session.get(Order, marketable.id).fill_price == 100.0
+    assert db.session.get(Order, resting.id).status == 'open'
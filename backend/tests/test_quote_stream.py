@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from services.fake_feed import FakePriceFeed
+from services.quote_stream import QuoteHub, TooManyStreams
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def pollers():
+    return [thread for thread in threading.enumerate() if thread.name.startswith('quote-poller-')]
+
+
+@pytest.fixture
+def hub():
+    hub = QuoteHub(fetch=FakePriceFeed(seed=7).quote, interval=0.01, queue_size=100)
+    yield hub
+    for subscription in list(hub._clients):
+        hub.unsubscribe(subscription)
+
+
+def test_one_poller_fans_out_to_every_subscriber(hub):
+    first = hub.subscribe(['AAPL'])
+    second = hub.subscribe(['AAPL', 'MSFT'])
+    assert hub.active_symbols() == ['AAPL', 'MSFT']
+    assert len([t for t in pollers() if t.name == 'quote-poller-AAPL']) == 1
+
+    assert first.queue.get(timeout=1)['symbol'] == 'AAPL'
+
+    # Both clients see the same AAPL updates
+    assert wait_for(lambda: second.queue.qsize() >= 6)
+    seen = set()
+    while not second.queue.empty():
+        event = second.queue.get_nowait()
+        seen.update([event['symbol']] if event['type'] == 'quote' else event['quotes'])
+    assert seen == {'AAPL', 'MSFT'}
+
+
+def test_only_changed_fields_are_published(hub):
+    subscription = hub.subscribe(['AAPL'])
+    first = subscription.queue.get(timeout=1)
+    assert first == {'type': 'quote', 'symbol': 'AAPL', 'changes': first['changes']}
+    assert first['changes']['name'] == 'AAPL'
+
+    later = subscription.queue.get(timeout=1)
+    assert later['type'] == 'quote'
+    assert 'price' in later['changes'] or 'volume' in later['changes']
+    # Fields that never move are only sent once
+    assert not {'symbol', 'name', 'open', 'previous_close'} & set(later['changes'])
+
+
+def test_unchanged_quotes_publish_nothing():
+    quote = {'symbol': 'AAPL', 'price': 100.0}
+    hub = QuoteHub(fetch=lambda symbol: dict(quote), interval=0.01)
+    subscription = hub.subscribe(['AAPL'])
+    assert subscription.queue.get(timeout=1)['changes'] == quote
+    time.sleep(0.1)
+    assert subscription.queue.empty()
+    hub.unsubscribe(subscription)
+
+
+def test_new_subscriber_starts_from_a_snapshot(hub):
+    first = hub.subscribe(['AAPL'])
+    first.queue.get(timeout=1)
+
+    late = hub.subscribe(['AAPL'])
+    event = late.queue.get_nowait()
+    assert event['type'] == 'snapshot'
+    assert event['quotes']['AAPL']['symbol'] == 'AAPL'
+
+
+def test_overflowing_client_is_resynced_with_a_snapshot():
+    hub = QuoteHub(fetch=FakePriceFeed(seed=3).quote, interval=0.005, queue_size=3)
+    slow = hub.subscribe(['AAPL'])
+    fast = hub.subscribe(['AAPL'])
+
+    # The slow client never reads, the fast one keeps up
+    def keep_up():
+        while not fast.queue.empty():
+            fast.queue.get_nowait()
+        return slow.dropped >= 3
+
+    assert wait_for(keep_up)
+    hub.unsubscribe(slow)
+    hub.unsubscribe(fast)
+    time.sleep(0.05)
+
+    events = [slow.queue.get_nowait() for _ in range(slow.queue.qsize())]
+    assert 1 <= len(events) <= 3
+    assert events[0]['type'] == 'snapshot'
+    assert events[0]['quotes']['AAPL']['symbol'] == 'AAPL'
+    assert all(event['type'] == 'quote' for event in events[1:])
+    assert fast.dropped == 0
+
+
+def test_poller_stops_with_its_last_subscriber(hub):
+    first = hub.subscribe(['AAPL'])
+    second = hub.subscribe(['AAPL'])
+    hub.unsubscribe(first)
+    assert hub.active_symbols() == ['AAPL']
+
+    hub.unsubscribe(second)
+    assert hub.active_symbols() == []
+    assert wait_for(lambda: not [t for t in pollers() if t.name == 'quote-poller-AAPL'])
+
+    # Subscribing again starts a fresh poller
+    third = hub.subscribe(['AAPL'])
+    assert third.queue.get(timeout=1)['type'] == 'quote'
+    hub.unsubscribe(third)
+
+
+def test_subscriptions_are_capped_per_process(hub):
+    hub.max_clients = 2
+    first = hub.subscribe(['AAPL'])
+    hub.subscribe(['MSFT'])
+    with pytest.raises(TooManyStreams):
+        hub.subscribe(['GOOG'])
+
+    hub.unsubscribe(first)
+    hub.subscribe(['GOOG'])
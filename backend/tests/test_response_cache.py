@@ -0,0 +1,53 @@
+import time
+
+from flask import Flask, g, request
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required
+
+from services.response_cache import LocalBackend, ResponseCache
+
+
+def test_local_entries_expire_after_their_ttl():
+    backend = LocalBackend()
+    backend.set('short', b'a', 0.05)
+    backend.set('long', b'b', 60)
+    assert backend.get('short') == b'a'
+
+    time.sleep(0.06)
+    assert backend.get('short') is None
+    assert backend.get('long') == b'b'
+
+
+def test_local_generations_count_invalidations():
+    backend = LocalBackend()
+    assert backend.generation('positions:1') == 0
+    backend.bump('positions:1')
+    backend.bump('positions:1')
+    assert backend.generation('positions:1') == 2
+    assert backend.generation('positions:2') == 0
+
+
+def test_responses_read_from_a_replica_are_not_stored():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'test'
+    JWTManager(app)
+    cache = ResponseCache()
+    cache.init_app(app)
+    calls = []
+
+    @app.route('/positions')
+    @jwt_required()
+    @cache.cached('positions')
+    def positions():
+        calls.append(1)
+        if request.args.get('replica'):
+            g.db_replica = 'replica_1'
+        return {'count': len(calls)}
+
+    with app.app_context():
+        headers = {'Authorization': f'Bearer {create_access_token(identity="1")}'}
+    client = app.test_client()
+
+    assert client.get('/positions?replica=1', headers=headers).json == {'count': 1}
+    assert client.get('/positions?replica=1', headers=headers).json == {'count': 2}
+    assert client.get('/positions', headers=headers).json == {'count': 3}
+    assert client.get('/positions', headers=headers).json == {'count': 3}
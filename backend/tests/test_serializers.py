@@ -0,0 +1,81 @@
+from datetime import date, datetime, timedelta
+import random
+
+import pytest
+
+from models.backtest import Backtest
+from models.db import db
+from models.portfolio import Portfolio, Position, Trade
+from models.serializers import backtest_dicts, position_dicts, strategy_dicts, trade_page
+from models.strategy import Strategy
+from models.user import User
+
+
+@pytest.fixture
+def portfolio(app):
+    rng = random.Random(5)
+    user = User(username='trader', email='trader@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    portfolio = Portfolio(initial_balance=100000.0, current_balance=rng.uniform(0, 1e5), user_id=user.id)
+    db.session.add(portfolio)
+
+    started = datetime(2024, 1, 2, 9, 30)
+    for i in range(3):
+        strategy = Strategy(name=f's{i}', description='d' if i else None, user_id=user.id,
+                            parameters={'symbol': 'SPY', 'short_ma': 5 + i}, indicators={'ma': [5, 20]},
+                            is_active=bool(i % 2))
+        db.session.add(strategy)
+        db.session.flush()
+        for j in range(4):
+            db.session.add(Backtest(
+                name=f'b{i}{j}', start_date=date(2023, 1, 1), end_date=date(2024, 1, 1),
+                initial_capital=10000.0, final_capital=rng.uniform(5000, 20000), profit_loss=rng.uniform(-5e3, 5e3),
+                profit_loss_percent=rng.uniform(-50, 50), max_drawdown=-rng.uniform(0, 60),
+                sharpe_ratio=rng.uniform(-2, 3) if j else None, trades_data=[], equity_curve=[],
+                strategy_id=strategy.id, created_at=started + timedelta(minutes=7 * i + j)
+            ))
+    for symbol in ('AAPL', 'MSFT', 'GOOG', 'TSLA'):
+        db.session.add(Position(symbol=symbol, quantity=rng.uniform(0.1, 500), entry_price=rng.uniform(1, 900),
+                                current_price=rng.uniform(1, 900), portfolio_id=portfolio.id))
+    for k in range(150):
+        db.session.add(Trade(symbol=rng.choice(['AAPL', 'MSFT']), quantity=rng.uniform(0.01, 100),
+                             price=rng.uniform(1, 900), direction=rng.choice(['buy', 'sell']),
+                             executed_at=started + timedelta(seconds=37 * k), portfolio_id=portfolio.id))
+    db.session.commit()
+    return portfolio
+
+
+def test_lists_match_to_dict_byte_for_byte(app, portfolio):
+    user_id = portfolio.user_id
+    strategies = Strategy.query.filter_by(user_id=user_id).all()
+    backtests = Backtest.query.filter(Backtest.strategy_id.in_([s.id for s in strategies])) \
+                              .order_by(Backtest.created_at.desc()).all()
+    positions = Position.query.filter_by(portfolio_id=portfolio.id).all()
+
+    assert app.json.dumps(strategy_dicts(user_id)) == app.json.dumps([s.to_dict() for s in strategies])
+    assert app.json.dumps(backtest_dicts(user_id)) == app.json.dumps([b.to_dict() for b in backtests])
+    assert app.json.dumps(position_dicts(portfolio.id)) == app.json.dumps([p.to_dict() for p in positions])
+
+
+@pytest.mark.parametrize('page, per_page', [(1, 20), (3, 20), (8, 20), (2, 7), (1, 100), (1, 150), (1, 500), (2, 101)])
+def test_trade_page_matches_paginate(app, portfolio, page, per_page):
+    with app.test_request_context():
+        expected = Trade.query.filter_by(portfolio_id=portfolio.id) \
+                              .order_by(Trade.executed_at.desc()) \
+                              .paginate(page=page, per_page=per_page)
+        items, total, pages = trade_page(portfolio.id, page, per_page)
+
+    assert app.json.dumps(items) == app.json.dumps([trade.to_dict() for trade in expected.items])
+    assert (total, pages) == (expected.total, expected.pages)
+
+
+@pytest.mark.parametrize('page, per_page', [(9, 20), (0, 20), (1, 0)])
+def test_trade_page_404s_like_paginate(app, portfolio, page, per_page):
+    from werkzeug.exceptions import NotFound
+
+    with app.test_request_context():
+        with pytest.raises(NotFound):
+            Trade.query.filter_by(portfolio_id=portfolio.id).paginate(page=page, per_page=per_page)
+        with pytest.raises(NotFound):
+            trade_page(portfolio.id, page, per_page)
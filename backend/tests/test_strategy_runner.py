@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+from models.db import db
+from models.portfolio import Portfolio, Trade
+from models.strategy import Strategy
+from models.user import User
+from services.strategy_runner import StrategyRunner
+
+
+def crossing_bars(symbol, interval):
+    """Hourly bars, long closed, whose short average crosses above the long one on the last bar"""
+    close = [10.0] * 6 + [8.0, 8.0, 12.0]
+    index = pd.date_range('2024-03-01 10:00', periods=len(close), freq='h', tz='America/New_York')
+    return pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close}, index=index)
+
+
+@pytest.fixture
+def strategy(app):
+    user = User(username='trader', email='trader@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Portfolio(user_id=user.id, initial_balance=10000.0, current_balance=10000.0))
+    strategy = Strategy(name='cross', user_id=user.id, is_active=True,
+                        parameters={'symbol': 'SPY', 'interval': '1h', 'short_ma': 2, 'long_ma': 3})
+    db.session.add(strategy)
+    db.session.commit()
+    return strategy
+
+
+def test_a_restarted_runner_does_not_repeat_the_last_bars_trade(app, strategy):
+    assert StrategyRunner(app, fetch_bars=crossing_bars).run_cycle()['orders'] == 1
+    assert StrategyRunner(app, fetch_bars=crossing_bars).run_cycle()['orders'] == 0
+    assert Trade.query.filter_by(strategy_id=strategy.id).count() == 1
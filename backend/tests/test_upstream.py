@@ -0,0 +1,190 @@
+import threading
+import time
+
+import pytest
+
+from services.fake_feed import FakeFeedError, FakePriceFeed
+from services.upstream import CircuitBreaker, TokenBucket, UpstreamGuard, UpstreamUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=3, clock=clock)
+    assert all(bucket.acquire() for _ in range(3))
+    assert not bucket.acquire()
+
+    clock.now += 0.5
+    assert bucket.acquire()
+    assert not bucket.acquire()
+
+    # Idle time never banks more than a burst
+    clock.now += 100
+    assert all(bucket.acquire() for _ in range(3))
+    assert not bucket.acquire()
+
+
+def test_token_bucket_waits_for_a_token_within_timeout():
+    bucket = TokenBucket(rate=20, burst=1)
+    assert bucket.acquire()
+    started = time.monotonic()
+    assert bucket.acquire(timeout=1.0)
+    assert 0.02 < time.monotonic() - started < 0.5
+    assert not bucket.acquire(timeout=0.0)
+
+
+def test_token_bucket_without_rate_is_unlimited():
+    bucket = TokenBucket(rate=0, burst=1)
+    assert all(bucket.acquire() for _ in range(100))
+
+
+def test_token_bucket_reserve_leaves_tokens_to_other_callers():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, burst=4, clock=clock)
+    assert bucket.acquire(reserve=2) and bucket.acquire(reserve=2)
+    assert not bucket.acquire(reserve=2)
+    assert bucket.acquire() and bucket.acquire()
+    assert not bucket.acquire()
+
+    clock.now += 2
+    assert not bucket.acquire(reserve=2)
+    assert bucket.acquire()
+
+
+def test_pollers_do_not_throttle_interactive_calls():
+    feed = FakePriceFeed()
+    guard = UpstreamGuard(rate=20, burst=4, timeout=1.0, poll_reserve=2)
+    stop = threading.Event()
+    polls = []
+
+    def poll():
+        while not stop.is_set():
+            polls.append(guard.poll(feed.quote, 'AAPL'))
+
+    pollers = [threading.Thread(target=poll) for _ in range(4)]
+    for thread in pollers:
+        thread.start()
+    try:
+        time.sleep(0.2)
+        for _ in range(5):
+            started = time.monotonic()
+            guard.call(feed.quote, 'MSFT')
+            assert time.monotonic() - started < 0.03
+            time.sleep(0.05)
+    finally:
+        stop.set()
+        for thread in pollers:
+            thread.join()
+    assert polls
+
+
+def test_circuit_breaker_opens_and_probes_once():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    assert breaker.retry_after() == 10
+
+    clock.now += 10
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_guard_opens_on_provider_errors_and_recovers():
+    feed = FakePriceFeed()
+    guard = UpstreamGuard(rate=0, burst=1, timeout=1.0, failure_threshold=2, reset_timeout=0.1)
+    feed.down = True
+    for _ in range(2):
+        with pytest.raises(FakeFeedError):
+            guard.call(feed.quote, 'AAPL')
+    with pytest.raises(UpstreamUnavailable, match='circuit open'):
+        guard.call(feed.quote, 'AAPL')
+
+    feed.down = False
+    time.sleep(0.15)
+    assert guard.call(feed.quote, 'AAPL')['symbol'] == 'AAPL'
+    assert guard.breaker.state == 'closed'
+
+
+def test_guard_times_out_slow_provider():
+    feed = FakePriceFeed(latency=0.4)
+    guard = UpstreamGuard(rate=0, burst=1, timeout=0.05, failure_threshold=1, reset_timeout=30)
+    with pytest.raises(UpstreamUnavailable, match='no response'):
+        guard.call(feed.quote, 'AAPL')
+    assert guard.breaker.state == 'open'
+
+
+def test_throttled_probe_does_not_wedge_breaker():
+    feed = FakePriceFeed()
+    guard = UpstreamGuard(rate=1, burst=1, timeout=0.05, failure_threshold=1, reset_timeout=0.1)
+    feed.down = True
+    with pytest.raises(FakeFeedError):
+        guard.call(feed.quote, 'AAPL')
+
+    # The only token was spent, so the first call after the reset is throttled
+    time.sleep(0.12)
+    feed.down = False
+    with pytest.raises(UpstreamUnavailable, match='rate limit'):
+        guard.call(feed.quote, 'AAPL')
+    assert guard.breaker.state == 'half_open'
+
+    # ...and must not have used up the probe
+    time.sleep(1.0)
+    assert guard.call(feed.quote, 'AAPL')['symbol'] == 'AAPL'
+    assert guard.breaker.state == 'closed'
+
+
+def test_cached_serves_stale_while_revalidating():
+    feed = FakePriceFeed(latency=0.05)
+    guard = UpstreamGuard(rate=0, burst=1, timeout=1.0, max_stale=60)
+    fetch = lambda: guard.call(feed.quote, 'AAPL')
+
+    first, meta = guard.cached('AAPL', fetch, ttl=0.3)
+    assert not meta['stale']
+    again, meta = guard.cached('AAPL', fetch, ttl=0.3)
+    assert again is first and not meta['stale']
+
+    time.sleep(0.35)
+    started = time.monotonic()
+    stale, meta = guard.cached('AAPL', fetch, ttl=0.3)
+    # Served from the cache without waiting on the slow provider
+    assert time.monotonic() - started < 0.025
+    assert stale is first and meta['stale'] and meta['age_seconds'] >= 0.3
+
+    time.sleep(0.15)
+    fresh, meta = guard.cached('AAPL', fetch, ttl=0.3)
+    assert fresh is not first and not meta['stale']
+
+
+def test_cached_prefers_stale_value_over_provider_error():
+    feed = FakePriceFeed()
+    guard = UpstreamGuard(rate=0, burst=1, timeout=1.0, failure_threshold=100, max_stale=0)
+    fetch = lambda: guard.call(feed.quote, 'AAPL')
+    first, _ = guard.cached('AAPL', fetch, ttl=0.05)
+
+    feed.down = True
+    time.sleep(0.06)
+    value, meta = guard.cached('AAPL', fetch, ttl=0.05)
+    assert value is first and meta['stale']
+
+    with pytest.raises(FakeFeedError):
+        guard.cached('MSFT', lambda: guard.call(feed.quote, 'MSFT'), ttl=0.05)